@@ -0,0 +1,156 @@
+"""
+后台任务执行器：从 JobStore 领取任务并在事件循环中执行。
+
+既可以随应用进程启动（FastAPI lifespan，JOB_WORKERS > 0），也可以作为独立进程运行:
+    python -m app.job_runner --workers 4
+独立 worker 与应用进程共享同一个 SQLite 任务表；此时可设置 JOB_WORKERS=0，应用进程只负责入队。
+"""
+import os
+import socket
+import asyncio
+import logging
+import argparse
+
+from fastapi import HTTPException
+
+from app.job_store import JobStore, get_job_store
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "5"))
+# 运行中任务超过这么久没有心跳，视为 worker 已失联
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "600"))
+
+
+class JobRunner:
+    """
+    Args:
+        handlers: {任务类型: async handler(payload) -> dict}，返回值作为任务结果保存
+        store: 任务表，None 使用共享的默认表
+        workers: 同时执行的任务数
+    """
+
+    def __init__(self, handlers: dict, store: JobStore | None = None, workers: int = JOB_WORKERS):
+        self.handlers = handlers
+        self.store = store or get_job_store()
+        self.workers = max(1, workers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: dict[str, asyncio.Task] = {}
+        self._cancelling: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        self._tasks.append(asyncio.create_task(self._maintenance()))
+        logger.info(f"任务执行器已启动: {self.workers} 个worker ({self.worker_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def submit(self, kind: str, payload: dict, idempotency_key: str | None = None):
+        """写入任务表并唤醒空闲 worker，返回 (任务, 是否新建)"""
+        if kind not in self.handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        # SQLite 写入放到线程里；asyncio.Event 不是线程安全的，回到事件循环后再唤醒
+        job, created = await asyncio.to_thread(self.store.create, kind, payload, idempotency_key)
+        if created:
+            self._wakeup.set()
+        return job, created
+
+    async def cancel(self, job_id: str):
+        """取消任务；由本进程执行的任务立即中断，其他进程中的任务在下次心跳时中断"""
+        job = await asyncio.to_thread(self.store.request_cancel, job_id)
+        # _running / task.cancel() 只能在事件循环线程中操作
+        self._cancel_local(job_id)
+        return job
+
+    def _cancel_local(self, job_id: str):
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelling.add(job_id)
+            task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.worker_id, self.handlers.keys())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self.handlers[job.kind](job.payload))
+            self._running[job.job_id] = task
+            logger.info(f"开始执行任务 {job.job_id} ({job.kind}, 第 {job.attempts} 次)")
+            try:
+                result = await task
+                await asyncio.to_thread(self.store.complete, job.job_id, result)
+            except asyncio.CancelledError:
+                if job.job_id not in self._cancelling:
+                    raise  # worker 自身被取消（应用关闭），任务留在运行中，由心跳超时重新排队
+                logger.info(f"任务 {job.job_id} 已取消")
+                await asyncio.to_thread(self.store.mark_cancelled, job.job_id)
+            except HTTPException as e:
+                await asyncio.to_thread(self.store.fail, job.job_id, str(e.detail))
+            except Exception as e:
+                logger.error(f"任务 {job.job_id} 执行失败: {e}", exc_info=True)
+                await asyncio.to_thread(self.store.fail, job.job_id, str(e))
+            finally:
+                self._running.pop(job.job_id, None)
+                self._cancelling.discard(job.job_id)
+
+    async def _maintenance(self):
+        """定期刷新心跳、响应跨进程取消、回收失联任务、清理过期结果"""
+        loop = asyncio.get_running_loop()
+        last_purge = 0.0
+        while True:
+            cancelled = await asyncio.to_thread(self.store.heartbeat, list(self._running))
+            for job_id in cancelled:
+                self._cancel_local(job_id)
+            await asyncio.to_thread(self.store.requeue_stale, JOB_STALE_AFTER)
+            if loop.time() - last_purge > JOB_PURGE_INTERVAL:
+                deleted = await asyncio.to_thread(self.store.purge)
+                if deleted:
+                    logger.info(f"已清理 {deleted} 个过期任务")
+                last_purge = loop.time()
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+
+
+async def _run_forever(workers: int):
+    from app.main import JOB_HANDLERS
+    from tools import llm_clients
+
+    await llm_clients.startup()
+    runner = JobRunner(JOB_HANDLERS, workers=workers)
+    await runner.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.stop()
+        await llm_clients.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="独立运行的后台任务 worker")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS or 4, help="同时执行的任务数")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_run_forever(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
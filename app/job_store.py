@@ -0,0 +1,241 @@
+"""
+后台任务的持久化存储（SQLite）。
+
+任务表记录类型、参数、状态、结果与错误，支持幂等键、跨进程取消标记、心跳与失联回收、
+以及已结束任务的定期清理。应用进程与独立 worker（python -m app.job_runner）共享同一个文件。
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join("output", "jobs.sqlite3"))
+# 已结束任务（成功/失败/取消）的保留时长，超时后连同结果一起删除
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "86400"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+_COLUMNS = ("job_id", "kind", "status", "idempotency_key", "payload_hash", "payload", "result", "error",
+            "attempts", "worker_id", "cancel_requested", "created_at", "started_at", "finished_at", "heartbeat_at")
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class IdempotencyConflict(Exception):
+    """同一个幂等键已用于内容不同的请求"""
+
+
+class Job:
+    def __init__(self, row):
+        data = dict(zip(_COLUMNS, row))
+        self.job_id = data["job_id"]
+        self.kind = data["kind"]
+        self.status = JobStatus(data["status"])
+        self.idempotency_key = data["idempotency_key"]
+        self.payload = json.loads(data["payload"])
+        self.result = json.loads(data["result"]) if data["result"] else None
+        self.error = data["error"]
+        self.attempts = data["attempts"]
+        self.worker_id = data["worker_id"]
+        self.cancel_requested = bool(data["cancel_requested"])
+        self.created_at = data["created_at"]
+        self.started_at = data["started_at"]
+        self.finished_at = data["finished_at"]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class JobStore:
+    """
+    SQLite 持久化的任务表，可被同一台机器上的多个进程（应用进程、独立 worker）共享。
+
+    任务状态: queued -> running -> done / failed / cancelled。
+    领取任务用单条 UPDATE ... RETURNING 完成，多个 worker 并发领取不会拿到同一个任务。
+
+    Args:
+        path: SQLite 文件路径
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "idempotency_key TEXT UNIQUE, payload_hash TEXT, payload TEXT NOT NULL, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, worker_id TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._lock = threading.Lock()
+
+    def _one(self, sql: str, params=()) -> Job | None:
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return Job(row) if row else None
+
+    def create(self, kind: str, payload: dict, idempotency_key: str | None = None) -> tuple[Job, bool]:
+        """
+        新建任务，返回 (任务, 是否新建)。
+
+        带幂等键时，同一个键重复提交返回已有任务；键相同但内容不同抛出 IdempotencyConflict。
+        """
+        body = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        payload_hash = hashlib.sha256(f"{kind}\n{body}".encode("utf-8")).hexdigest()
+        if idempotency_key:
+            existing = self._one(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE idempotency_key = ?", (idempotency_key,))
+            if existing is not None:
+                if self._payload_hash(existing.job_id) != payload_hash:
+                    raise IdempotencyConflict(idempotency_key)
+                return existing, False
+        job_id = str(uuid.uuid4())
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, kind, status, idempotency_key, payload_hash, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, JobStatus.QUEUED.value, idempotency_key, payload_hash, body, time.time()),
+                )
+        except sqlite3.IntegrityError:
+            # 另一个请求抢先用同一个键建了任务
+            return self.create(kind, payload, idempotency_key)
+        return self.get(job_id), True
+
+    def _payload_hash(self, job_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT payload_hash FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, job_id: str) -> Job | None:
+        return self._one(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,))
+
+    def claim(self, worker_id: str, kinds) -> Job | None:
+        """领取最早的一个排队任务并标记为运行中"""
+        kinds = list(kinds)
+        now = time.time()
+        return self._one(
+            f"UPDATE jobs SET status = ?, worker_id = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+            f"WHERE job_id = (SELECT job_id FROM jobs WHERE status = ? AND kind IN ({', '.join('?' * len(kinds))}) "
+            f"ORDER BY created_at LIMIT 1) AND status = ? RETURNING {', '.join(_COLUMNS)}",
+            (JobStatus.RUNNING.value, worker_id, now, now, JobStatus.QUEUED.value, *kinds, JobStatus.QUEUED.value),
+        )
+
+    def heartbeat(self, job_ids) -> set[str]:
+        """刷新运行中任务的心跳，返回其中被请求取消的任务 id"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        placeholders = ", ".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE job_id IN ({placeholders})", (time.time(), *job_ids))
+            rows = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({placeholders})", job_ids
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def _finish(self, job_id: str, status: JobStatus, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                (status.value, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 time.time(), job_id, JobStatus.RUNNING.value),
+            )
+
+    def complete(self, job_id: str, result: dict):
+        self._finish(job_id, JobStatus.DONE, result=result)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, JobStatus.FAILED, error=error)
+
+    def mark_cancelled(self, job_id: str):
+        self._finish(job_id, JobStatus.CANCELLED, error="任务已取消")
+
+    def request_cancel(self, job_id: str) -> Job | None:
+        """排队中的任务直接取消；运行中的任务打上取消标记，由执行它的 worker 中断"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                (JobStatus.CANCELLED.value, "任务已取消", time.time(), job_id, JobStatus.QUEUED.value),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?",
+                (job_id, JobStatus.RUNNING.value),
+            )
+        return self.get(job_id)
+
+    def requeue_stale(self, stale_after: float, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """心跳超时的运行中任务（worker 崩溃或被杀）重新排队；已请求取消的标记为取消，超过重试次数的标记失败"""
+        cutoff = time.time() - stale_after
+        with self._lock:
+            # 已请求取消的任务不再重试，直接按取消处理
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND cancel_requested = 1",
+                (JobStatus.CANCELLED.value, "任务已取消", time.time(), JobStatus.RUNNING.value, cutoff),
+            ).rowcount
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                (JobStatus.FAILED.value, "worker 失联，任务中止", time.time(), JobStatus.RUNNING.value, cutoff, max_attempts),
+            ).rowcount
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL WHERE status = ? AND heartbeat_at < ?",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value, cutoff),
+            ).rowcount
+        if failed or requeued or cancelled:
+            logger.warning(f"心跳超时的任务: {requeued} 个重新排队, {failed} 个标记失败, {cancelled} 个已取消")
+        return requeued
+
+    def purge(self, retention: float = JOB_RETENTION_SECONDS) -> int:
+        """删除结束超过 retention 秒的任务"""
+        with self._lock:
+            deleted = self._conn.execute(
+                f"DELETE FROM jobs WHERE finished_at < ? AND status IN ({', '.join('?' * len(FINISHED_STATUSES))})",
+                (time.time() - retention, *(s.value for s in FINISHED_STATUSES)),
+            ).rowcount
+        return deleted
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status.value: 0 for status in JobStatus}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """获取进程内共享的任务表（懒加载）"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = JobStore()
+        return _default_store
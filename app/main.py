@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, Request, HTTPException, Query, Header
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
+from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
@@ -8,11 +9,31 @@ import os
 import uuid
 import logging
 import asyncio
+import json
+import time
 from dotenv import load_dotenv
-import requests
-from tools.llm_prompt import call_ark_llm, extract_html_from_response
-from tools.prompt_config import SYSTEM_PROMPT_WEB_DESIGNER, USER_PROMPT_WEB_DESIGNER, SYSTEM_PROMPT_SUMMARIZE_2MD
-from tools.llm_caller import generate_content_with_llm
+import httpx
+from tools.llm_prompt import extract_html_from_response
+from tools.html_extractor import HtmlStreamExtractor
+from tools.prompt_config import SYSTEM_PROMPT_WEB_DESIGNER, USER_PROMPT_WEB_DESIGNER
+from tools.llm_caller import generate_content_with_llm, stream_content_with_llm, router as llm_router
+from tools.selenium2img import render_card
+from tools.render_cache import get_render_cache
+from tools.llm_cache import get_llm_cache
+from tools import llm_clients, single_flight
+from tools.browser_pool import shutdown_browser_pool
+from tools.card_extractor import extractor_stats, shutdown_extract_pool
+from tools.exporter import MEDIA_TYPES, export_html, parse_formats
+from tools.asset_cache import get_asset_cache
+from tools.summarizer import summarize
+from tools.web_fetcher import WebFetchTooLarge, fetch_web, get_web_fetch_cache, shutdown_web_fetcher
+from tools import metrics
+from tools.metrics import timed
+from tools.browser_pool import get_browser_pool
+from app.render_queue import RenderQueue, RenderQueueFull, RenderJobStatus
+from app.job_store import IdempotencyConflict
+from app.job_runner import JOB_WORKERS, JobRunner
+from app.storage import get_storage, run_eviction_loop
 import os
 from enum import Enum
 
@@ -22,18 +43,41 @@ logger = logging.getLogger(__name__)
 env_path = os.path.join(os.path.dirname(__file__), "..", "tools", ".env")
 load_dotenv(env_path)
 
-JINA_API_URL = "https://r.jina.ai/"
 JINA_API_KEY = os.getenv("JINA_API_KEY")
 
 logger.info(f"Loading environment variables from: {env_path}")
 logger.info(f"JINA_API_KEY loaded: {'Yes' if JINA_API_KEY else 'No'}")
 
-app = FastAPI()
-
 OUTPUT_DIR = "output"
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# 为所有响应附加 Server-Timing 头；关闭时仍可通过请求头 X-Server-Timing: 1 按需开启
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
 STATIC_DIR = "static"
 TEMPLATES_DIR = "templates"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await llm_clients.startup()
+    app.state.render_queue = RenderQueue(_render_to_storage)
+    await app.state.render_queue.start()
+    # JOB_WORKERS=0 时只负责入队，任务由独立的 python -m app.job_runner 进程执行
+    app.state.job_runner = JobRunner(JOB_HANDLERS)
+    if JOB_WORKERS > 0:
+        await app.state.job_runner.start()
+    eviction = asyncio.create_task(run_eviction_loop(get_storage()))
+    yield
+    eviction.cancel()
+    await asyncio.gather(eviction, return_exceptions=True)
+    await app.state.job_runner.stop()
+    await app.state.render_queue.stop()
+    await asyncio.to_thread(shutdown_browser_pool)
+    await asyncio.to_thread(shutdown_extract_pool)
+    await shutdown_web_fetcher()
+    await llm_clients.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 app_static_dir = os.path.join(os.path.dirname(__file__), STATIC_DIR)
 os.makedirs(app_static_dir, exist_ok=True)
@@ -41,6 +85,99 @@ app.mount(f"/{STATIC_DIR}", StaticFiles(directory=app_static_dir), name=STATIC_D
 
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "..", TEMPLATES_DIR))
 
+class TimingMiddleware:
+    """
+    记录每个请求的耗时直方图；开启时把请求内各阶段耗时写入 Server-Timing 响应头。
+
+    使用纯 ASGI 中间件而不是 BaseHTTPMiddleware，处理函数与中间件在同一个任务中运行，
+    阶段耗时的 ContextVar 和断连检测都不受影响。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with_header = SERVER_TIMING or dict(scope["headers"]).get(b"x-server-timing") == b"1"
+        timings = metrics.start_request_timing()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if with_header:
+                    header = metrics.format_server_timing(timings, total=time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route.path if route else "unmatched",
+                status=status,
+            )
+
+app.add_middleware(TimingMiddleware)
+
+@metrics.register_collector
+async def _runtime_metrics():
+    samples = []
+    queue = getattr(app.state, "render_queue", None)
+    if queue is not None:
+        running = sum(1 for job in list(queue.jobs.values()) if job.status == RenderJobStatus.RUNNING)
+        samples += [
+            ("render_queue_depth", "Render jobs waiting in the queue.", {}, queue.queue.qsize()),
+            ("render_queue_capacity", "Render queue capacity.", {}, queue.queue.maxsize),
+            ("render_jobs_running", "Render jobs currently running.", {}, running),
+        ]
+    runner = getattr(app.state, "job_runner", None)
+    if runner is not None:
+        # 任务表和存储索引的统计都是 SQLite 查询，放到线程里执行
+        job_counts = await asyncio.to_thread(runner.store.counts)
+        for status, count in job_counts.items():
+            samples.append(("jobs", "Background jobs by status.", {"status": status}, count))
+        samples.append(("job_runner_in_flight", "Background jobs running in this process.", {}, runner.in_flight()))
+    storage = await asyncio.to_thread(get_storage().stats)
+    samples += [
+        ("storage_bytes", "Bytes of card artifacts in storage.", {}, storage["bytes"]),
+        ("storage_budget_bytes", "Storage size budget in bytes (0 = unlimited).", {}, storage["max_bytes"]),
+        ("storage_cards", "Cards with artifacts in storage.", {}, storage["cards"]),
+        ("storage_evicted_total", "Cards evicted by TTL or size budget.", {}, storage["evicted"]),
+    ]
+    pool = get_browser_pool().snapshot()
+    in_use = pool["created"] - pool["idle"]
+    samples += [
+        ("browser_pool_size", "Maximum number of pooled browsers.", {}, pool["size"]),
+        ("browser_pool_in_use", "Browsers currently checked out.", {}, in_use),
+        ("browser_pool_utilization", "Fraction of the browser pool checked out.", {}, in_use / pool["size"]),
+        ("browser_pool_launched_total", "Browsers launched.", {}, pool["launched"]),
+        ("browser_pool_recycled_total", "Browsers recycled after max renders.", {}, pool["recycled"]),
+    ]
+    caches = {"render": get_render_cache().stats(), "asset": get_asset_cache().stats(), "web_fetch": get_web_fetch_cache().stats()}
+    llm_cache = get_llm_cache()
+    if llm_cache:
+        caches["llm"] = llm_cache.stats()
+    for name, stats in caches.items():
+        lookups = stats["hits"] + stats["misses"]
+        samples += [
+            ("cache_hits_total", "Cache hits.", {"cache": name}, stats["hits"]),
+            ("cache_misses_total", "Cache misses.", {"cache": name}, stats["misses"]),
+            ("cache_hit_ratio", "Cache hit ratio since start.", {"cache": name}, stats["hits"] / lookups if lookups else 0.0),
+        ]
+    for name, stats in llm_router.stats()["providers"].items():
+        samples.append(("llm_provider_in_flight", "In-flight LLM requests.", {"provider": name}, stats["in_flight"]))
+    for name, stats in single_flight.all_stats().items():
+        samples.append(("single_flight_in_flight", "Coalesced calls in flight.", {"name": name}, stats["in_flight"]))
+    return samples
+
 class MarkdownRequest(BaseModel):
     markdown: str
     style: Optional[str] = Field(default="default")
@@ -60,6 +197,11 @@ class GenerationRequest(BaseModel):
     model: Optional[str] = None
     temperature: Optional[float] = 0.7
 
+class BatchGenerationRequest(BaseModel):
+    items: List[GenerationRequest]
+    concurrency: Optional[int] = None
+    render: bool = False
+
 class GenerationResponseData(BaseModel):
     file_id: str
     success: bool
@@ -84,22 +226,86 @@ class WebFetchResponse(BaseModel):
     success: bool
     message: Optional[str] = None
 
+class PipelineRequest(BaseModel):
+    url: Optional[str] = None
+    content: Optional[str] = None
+    summarize: bool = True
+    instructions: Optional[str] = None
+    model: Optional[str] = None
+    temperature: Optional[float] = 0.7
+    render: bool = True
+
 class GenerationResponse(BaseModel):
     file_id: str
     html_url: str
 
+class ExportedFile(BaseModel):
+    url: str
+    media_type: str
+    size: int
+
+class ExportResponse(BaseModel):
+    file_id: str
+    files: dict[str, ExportedFile]
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    status_url: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+class RenderJobResponse(BaseModel):
+    job_id: str
+    file_id: str
+    status: str
+    status_url: str
+    image_url: Optional[str] = None
+    error: Optional[str] = None
+
+def _render_to_storage(html_path: str, image_path: str) -> bool:
+    """渲染队列的渲染函数：渲染完成后把 PNG 登记到存储索引"""
+    ok = render_card(html_path, image_path)
+    if ok:
+        get_storage().record(image_path)
+    return ok
+
+def _export_to_storage(file_id: str, html_path: str, formats: list, options: dict) -> dict:
+    """渲染队列中执行的导出：各格式直接写入存储，只返回 {格式: 字节数}，导出内容不留在任务对象里"""
+    storage = get_storage()
+    sizes = {}
+    for fmt, data in export_html(html_path, formats, options).items():
+        storage.write(file_id, f"_export.{fmt}", data)
+        sizes[fmt] = len(data)
+    return sizes
+
 def generate_html_from_markdown(markdown_content: str, style: str, file_id: str, request: Request):
     basic_html_content = markdown_content
     full_html = templates.get_template("card_template.html").render(
         {"request": request, "content": basic_html_content, "style": style}
     )
-    html_path = os.path.join(OUTPUT_DIR, f"{file_id}.html")
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(full_html)
+    html_path = get_storage().write(file_id, ".html", full_html)
     logger.info(f"HTML file generated: {html_path}")
     return html_path
 
-async def generate_card(payload: GenerationRequest) -> GenerationResponseData:
+async def cancel_on_disconnect(request: Optional[Request], coro):
+    """等待上游调用完成；客户端提前断开时取消该调用，不再占用上游连接"""
+    task = asyncio.ensure_future(coro)
+    if request is None:
+        return await task
+    while not task.done():
+        await asyncio.wait({task}, timeout=1.0)
+        if not task.done() and await request.is_disconnected():
+            logger.info("客户端已断开连接，取消上游LLM请求")
+            task.cancel()
+            break
+    return await task
+
+async def generate_card(payload: GenerationRequest, request: Optional[Request] = None) -> GenerationResponseData:
     file_id = str(uuid.uuid4())
     llm_raw_response = ""
     html_path = ""
@@ -112,28 +318,26 @@ async def generate_card(payload: GenerationRequest) -> GenerationResponseData:
         
         combined_prompt = USER_PROMPT_WEB_DESIGNER + payload.prompt
         
-        prompt_path = os.path.join(OUTPUT_DIR, f"{file_id}_prompt.txt")
-        with open(prompt_path, "w", encoding="utf-8") as f:
-            f.write(payload.prompt)
+        await asyncio.to_thread(get_storage().write, file_id, "_prompt.txt", payload.prompt)
         
         try:
             logger.info(f"使用模型 '{payload.model or 'default'}' 调用LLM")
             
-            model_to_use = payload.model or "deepseek-v3-250324"  
-            temperature_to_use = payload.temperature or 0.7       
+            temperature_to_use = 0.7 if payload.temperature is None else payload.temperature
             
-            llm_raw_response = await asyncio.to_thread(
-                call_ark_llm,
+            # 经由 provider 路由：并发上限、限流、429 重试与故障转移
+            llm_raw_response = await cancel_on_disconnect(request, generate_content_with_llm(
                 prompt=combined_prompt,
-                model_id=model_to_use,
-                temperature=temperature_to_use
-            )
+                model=payload.model,
+                temperature=temperature_to_use,
+                sys_prompt=SYSTEM_PROMPT_WEB_DESIGNER,
+            ))
             
-            html_content = extract_html_from_response(llm_raw_response)
+            with timed("html_extract"):
+                html_content = extract_html_from_response(llm_raw_response)
             
-            html_path = os.path.join(OUTPUT_DIR, f"{file_id}.html")
-            with open(html_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
+            with timed("file_write"):
+                html_path = await asyncio.to_thread(get_storage().write, file_id, ".html", html_content)
             logger.info(f"HTML内容已保存到: {html_path}")
             
         except Exception as e:
@@ -144,9 +348,8 @@ async def generate_card(payload: GenerationRequest) -> GenerationResponseData:
         if not payload.html_input:
             raise HTTPException(status_code=400, detail="PASTE模式需要提供HTML输入")
         logger.info(f"处理PASTE模式 - file_id: {file_id}")
-        html_path = os.path.join(OUTPUT_DIR, f"{file_id}.html")
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(payload.html_input)
+        with timed("file_write"):
+            html_path = await asyncio.to_thread(get_storage().write, file_id, ".html", payload.html_input)
         logger.info(f"HTML文件已直接保存: {html_path}")
     else:
         raise HTTPException(status_code=400, detail="无效的生成模式")
@@ -163,10 +366,266 @@ async def generate_card(payload: GenerationRequest) -> GenerationResponseData:
     
     return response_data
 
+async def _run_generate_job(payload: dict) -> dict:
+    result = await generate_card(GenerationRequest(**payload))
+    return result.model_dump(exclude={"raw_llm_response"})
+
+# 后台任务类型 -> 处理函数，独立 worker 进程也从这里加载
+JOB_HANDLERS = {"generate": _run_generate_job}
+
+def _job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id=job.job_id,
+        kind=job.kind,
+        status=job.status.value,
+        status_url=f"/api/jobs/{job.job_id}",
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        result=job.result,
+        error=job.error,
+    )
+
 @app.post("/api/generate")
-async def generate_files(payload: GenerationRequest):
-    response_data = await generate_card(payload)
-    return response_data
+async def generate_files(
+    payload: GenerationRequest,
+    request: Request,
+    background: bool = Query(False),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    生成卡片。background=true 时立即返回 202 和任务 id，生成在后台任务中进行，
+    通过 /api/jobs/{job_id} 查询结果；请求头 Idempotency-Key 相同的重复提交返回同一个任务。
+    """
+    if not background:
+        response_data = await generate_card(payload, request)
+        return response_data
+
+    try:
+        job, created = await request.app.state.job_runner.submit(
+            "generate", payload.model_dump(mode="json"), idempotency_key
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key 已用于内容不同的请求")
+    if created:
+        logger.info(f"生成任务已入队 - job_id: {job.job_id}")
+    return JSONResponse(status_code=202, content=_job_response(job).model_dump())
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def job_status(job_id: str, request: Request):
+    job = await asyncio.to_thread(request.app.state.job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str, request: Request):
+    job = await request.app.state.job_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/generate/stream")
+async def generate_stream(payload: GenerationRequest):
+    """
+    以 Server-Sent Events 流式返回 PROMPT 模式的生成结果。
+
+    事件类型:
+        html: 增量 HTML 片段 {"text": ...}，拼接后即为卡片 HTML
+        done: 文件已保存 {file_id, html_path, ...}
+        error: 生成失败 {"message": ...}
+    """
+    if payload.mode != GenerationMode.PROMPT:
+        raise HTTPException(status_code=400, detail="流式生成仅支持PROMPT模式")
+    if not payload.prompt:
+        raise HTTPException(status_code=400, detail="PROMPT模式需要提供prompt")
+
+    file_id = str(uuid.uuid4())
+    logger.info(f"处理流式PROMPT模式 - file_id: {file_id}")
+    await asyncio.to_thread(get_storage().write, file_id, "_prompt.txt", payload.prompt)
+
+    async def event_stream():
+        extractor = HtmlStreamExtractor()
+        parts = []
+        try:
+            async for delta in stream_content_with_llm(
+                prompt=USER_PROMPT_WEB_DESIGNER + payload.prompt,
+                model=payload.model,
+                temperature=0.7 if payload.temperature is None else payload.temperature,
+                sys_prompt=SYSTEM_PROMPT_WEB_DESIGNER,
+            ):
+                parts.append(delta)
+                html_piece = extractor.feed(delta)
+                if html_piece:
+                    yield _sse("html", {"text": html_piece})
+
+            # 最终文件仍以完整响应的提取结果为准
+            with timed("html_extract"):
+                html_content = extract_html_from_response("".join(parts))
+            html_path = await asyncio.to_thread(get_storage().write, file_id, ".html", html_content)
+            logger.info(f"HTML内容已保存到: {html_path}")
+
+            response_data = GenerationResponseData(
+                file_id=file_id,
+                success=True,
+                html_path=f"/api/download-html/{file_id}",
+                message="HTML卡片生成成功"
+            )
+            yield _sse("done", response_data.model_dump())
+        except Exception as e:
+            logger.error(f"流式生成失败: {e}", exc_info=True)
+            yield _sse("error", {"file_id": file_id, "message": f"LLM调用期间发生错误: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _generate_batch_item(index: int, item: GenerationRequest, render: bool, app_state) -> dict:
+    try:
+        result = await generate_card(item)
+        data = {"index": index, **result.model_dump(exclude={"raw_llm_response"})}
+        if render:
+            html_path = await asyncio.to_thread(get_storage().locate, result.file_id, ".html")
+            image_path = await asyncio.to_thread(get_storage().path, result.file_id, ".png")
+            job = await app_state.render_queue.enqueue(result.file_id, html_path, image_path)
+            await job.wait()
+            if job.status == RenderJobStatus.DONE:
+                data["image_url"] = f"/api/download-image/{result.file_id}"
+            else:
+                data["success"] = False
+                data["message"] = f"渲染失败: {job.error}"
+        return data
+    except HTTPException as e:
+        return {"index": index, "success": False, "message": str(e.detail)}
+    except Exception as e:
+        logger.error(f"批量生成第 {index} 项失败: {e}", exc_info=True)
+        return {"index": index, "success": False, "message": str(e)}
+
+@app.post("/api/generate/batch")
+async def generate_batch(batch: BatchGenerationRequest, request: Request):
+    """
+    批量生成卡片，按完成顺序以 NDJSON 逐行返回每一项的结果。
+
+    单项失败不影响其他项；最后一行是汇总 {"done": true, "total", "succeeded", "failed"}。
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="items不能为空")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多提交{BATCH_MAX_ITEMS}项")
+
+    concurrency = min(batch.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    app_state = request.app.state
+
+    async def run(index: int, item: GenerationRequest) -> dict:
+        async with semaphore:
+            return await _generate_batch_item(index, item, batch.render, app_state)
+
+    async def result_stream():
+        tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(batch.items)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                data = await next_done
+                succeeded += 1 if data.get("success") else 0
+                yield json.dumps(data, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "total": len(tasks), "succeeded": succeeded,
+                              "failed": len(tasks) - succeeded}) + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的项
+            for task in tasks:
+                task.cancel()
+
+    logger.info(f"批量生成 {len(batch.items)} 项，并发 {concurrency}")
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/pipeline")
+async def run_pipeline(payload: PipelineRequest, request: Request):
+    """
+    在服务端串联 抓取网页 -> 总结 -> 生成卡片 -> 渲染图片，以 Server-Sent Events 推送各阶段进度。
+
+    文章全文、摘要和 HTML 都留在服务端，客户端只需一次请求。提供 url 时先抓取网页，
+    否则直接使用 content；summarize=false 时跳过总结，原文直接作为生成提示词。
+
+    事件类型:
+        stage: 阶段开始/完成 {"stage": fetch|summarize|generate|render, "status": started|done, ...}
+        done: 全部完成 {file_id, html_url, image_url}
+        error: 某一阶段失败 {"stage", "message"}，之后不再有事件
+    """
+    url = (payload.url or "").strip()
+    if not url and not payload.content:
+        raise HTTPException(status_code=400, detail="需要提供url或content")
+    if url and not JINA_API_KEY:
+        raise HTTPException(status_code=500, detail="Jina API密钥未配置，请检查环境变量")
+    app_state = request.app.state
+
+    async def event_stream():
+        stage = "fetch"
+        started = time.perf_counter()
+
+        def stage_done(**data):
+            return _sse("stage", {"stage": stage, "status": "done",
+                                  "seconds": round(time.perf_counter() - started, 3), **data})
+
+        try:
+            content = payload.content or ""
+            if url:
+                yield _sse("stage", {"stage": stage, "status": "started"})
+                content = await fetch_web(url, JINA_API_KEY)
+                yield stage_done(chars=len(content))
+
+            summary = None
+            if payload.summarize:
+                stage, started = "summarize", time.perf_counter()
+                yield _sse("stage", {"stage": stage, "status": "started", "chars": len(content)})
+                summary = (await summarize(content, model=payload.model)).strip()
+                yield stage_done(chars=len(summary))
+
+            stage, started = "generate", time.perf_counter()
+            yield _sse("stage", {"stage": stage, "status": "started"})
+            prompt = summary if summary is not None else content
+            if payload.instructions:
+                prompt = f"{prompt}\n\n{payload.instructions}"
+            # 断开连接时整个流会被取消，这里不再单独检测
+            result = await generate_card(GenerationRequest(
+                mode=GenerationMode.PROMPT,
+                prompt=prompt,
+                model=payload.model,
+                temperature=payload.temperature,
+            ))
+            html_url = f"/api/download-html/{result.file_id}"
+            yield stage_done(file_id=result.file_id, html_url=html_url)
+
+            image_url = None
+            if payload.render:
+                stage, started = "render", time.perf_counter()
+                yield _sse("stage", {"stage": stage, "status": "started"})
+                html_path = await asyncio.to_thread(get_storage().locate, result.file_id, ".html")
+                image_path = await asyncio.to_thread(get_storage().path, result.file_id, ".png")
+                job = await app_state.render_queue.enqueue(result.file_id, html_path, image_path)
+                await job.wait()
+                if job.status != RenderJobStatus.DONE:
+                    raise RuntimeError(job.error or "渲染失败")
+                image_url = f"/api/download-image/{result.file_id}"
+                yield stage_done(image_url=image_url)
+
+            yield _sse("done", {"file_id": result.file_id, "html_url": html_url, "image_url": image_url})
+        except HTTPException as e:
+            yield _sse("error", {"stage": stage, "message": str(e.detail)})
+        except Exception as e:
+            logger.error(f"流水线 {stage} 阶段失败: {e}", exc_info=True)
+            yield _sse("error", {"stage": stage, "message": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/")
 async def read_root(request: Request):
@@ -174,13 +633,153 @@ async def read_root(request: Request):
 
 @app.get("/api/download-html/{file_id}")
 async def download_html(file_id: str):
-    file_path = os.path.join(OUTPUT_DIR, f"{file_id}.html")
-    if not os.path.exists(file_path):
+    file_path = await asyncio.to_thread(get_storage().locate, file_id, ".html")
+    if file_path is None:
         raise HTTPException(status_code=404, detail="HTML file not found")
     return FileResponse(file_path, media_type='text/html', filename=f"{file_id}.html")
 
+def _render_job_response(job) -> RenderJobResponse:
+    return RenderJobResponse(
+        job_id=job.job_id,
+        file_id=job.file_id,
+        status=job.status.value,
+        status_url=f"/api/render-jobs/{job.job_id}",
+        image_url=f"/api/download-image/{job.file_id}" if job.status == RenderJobStatus.DONE else None,
+        error=job.error,
+    )
+
+@app.post("/api/render-image/{file_id}", status_code=202, response_model=RenderJobResponse)
+async def render_image(file_id: str, request: Request):
+    html_path = await asyncio.to_thread(get_storage().locate, file_id, ".html")
+    if html_path is None:
+        raise HTTPException(status_code=404, detail="HTML file not found")
+    image_path = await asyncio.to_thread(get_storage().path, file_id, ".png")
+    try:
+        job = request.app.state.render_queue.submit(file_id, html_path, image_path)
+    except RenderQueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail="渲染队列已满，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    logger.info(f"渲染任务已入队 - job_id: {job.job_id}, file_id: {file_id}")
+    return _render_job_response(job)
+
+@app.get("/api/render-jobs/{job_id}", response_model=RenderJobResponse)
+async def render_job_status(job_id: str, request: Request):
+    job = request.app.state.render_queue.get(job_id)
+    # 导出等非渲染任务只在队列内部使用，没有可下载的图片
+    if job is None or job.kind != "render":
+        raise HTTPException(status_code=404, detail="Render job not found")
+    return _render_job_response(job)
+
+@app.get("/api/download-image/{file_id}")
+async def download_image(file_id: str):
+    file_path = await asyncio.to_thread(get_storage().locate, file_id, ".png")
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Image file not found")
+    return FileResponse(file_path, media_type='image/png', filename=f"{file_id}.png")
+
+@app.post("/api/export/{file_id}", response_model=ExportResponse)
+async def export_file(
+    file_id: str,
+    request: Request,
+    formats: str = "png",
+    webp_quality: Optional[int] = Query(None, ge=0, le=100),
+    avif_quality: Optional[int] = Query(None, ge=0, le=100),
+    png_compression: Optional[int] = Query(None, ge=0, le=9),
+    max_width: Optional[int] = Query(None, ge=1),
+):
+    html_path = await asyncio.to_thread(get_storage().locate, file_id, ".html")
+    if html_path is None:
+        raise HTTPException(status_code=404, detail="HTML file not found")
+    try:
+        requested = parse_formats(formats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    options = {"png": {}, "webp": {}, "avif": {}}
+    if webp_quality is not None:
+        options["webp"]["quality"] = webp_quality
+    if avif_quality is not None:
+        options["avif"]["quality"] = avif_quality
+    if png_compression is not None:
+        options["png"]["compression"] = png_compression
+    if max_width is not None:
+        for raster in options.values():
+            raster["max_width"] = max_width
+
+    # 导出同样占用浏览器，经渲染队列执行，队列满时与渲染接口一样返回 429
+    try:
+        job = request.app.state.render_queue.submit_call(
+            file_id, html_path, lambda: _export_to_storage(file_id, html_path, requested, options), kind="export"
+        )
+    except RenderQueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail="渲染队列已满，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    await job.wait()
+    if job.status != RenderJobStatus.DONE:
+        logger.error(f"导出失败 - file_id: {file_id}, 错误: {job.error}")
+        raise HTTPException(status_code=500, detail=f"导出失败: {job.error}")
+    sizes, job.result = job.result, None
+
+    files = {
+        fmt: ExportedFile(url=f"/api/download-export/{file_id}/{fmt}", media_type=MEDIA_TYPES[fmt], size=size)
+        for fmt, size in sizes.items()
+    }
+    return ExportResponse(file_id=file_id, files=files)
+
+@app.get("/api/download-export/{file_id}/{fmt}")
+async def download_export(file_id: str, fmt: str):
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    file_path = await asyncio.to_thread(get_storage().locate, file_id, f"_export.{fmt}")
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Exported file not found")
+    return FileResponse(file_path, media_type=MEDIA_TYPES[fmt], filename=f"{file_id}.{fmt}")
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=await metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/storage/stats")
+async def storage_stats():
+    return await asyncio.to_thread(get_storage().stats)
+
+@app.get("/api/render-cache/stats")
+async def render_cache_stats():
+    return get_render_cache().stats()
+
+@app.get("/api/asset-cache/stats")
+async def asset_cache_stats():
+    return get_asset_cache().stats()
+
+@app.get("/api/web-fetch-cache/stats")
+async def web_fetch_cache_stats():
+    return get_web_fetch_cache().stats()
+
+@app.get("/api/llm-cache/stats")
+async def llm_cache_stats():
+    cache = get_llm_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+@app.get("/api/single-flight/stats")
+async def single_flight_stats():
+    return single_flight.all_stats()
+
+@app.get("/api/llm-router/stats")
+async def llm_router_stats():
+    return llm_router.stats()
+
+@app.get("/api/card-extractor/stats")
+async def card_extractor_stats():
+    return extractor_stats()
+
 @app.post("/api/summarize", response_model=SummarizeResponse)
-async def summarize_content(summarize_req: SummarizeRequest):
+async def summarize_content(summarize_req: SummarizeRequest, request: Request):
     try:
         content = summarize_req.content
 
@@ -191,19 +790,8 @@ async def summarize_content(summarize_req: SummarizeRequest):
                 message="请提供需要总结的内容"
             )
 
-        summarize_prompt = f"""请对以下内容进行简洁明了的总结，突出关键信息，保持语言简练：
-
-{content}
-
-总结：
-"""
-
-        summary = await generate_content_with_llm(
-            prompt=summarize_prompt,
-            sys_prompt=SYSTEM_PROMPT_SUMMARIZE_2MD,
-            model=summarize_req.model,
-            temperature=0.5  
-        )
+        # 长文按块并行总结后再汇总，短文仍是单次调用
+        summary = await cancel_on_disconnect(request, summarize(content, model=summarize_req.model))
 
         return SummarizeResponse(
             summary=summary.strip(),
@@ -230,8 +818,6 @@ async def fetch_web_content(fetch_req: WebFetchRequest):
                 message="请提供有效的URL"
             )
 
-        jina_url = f"{JINA_API_URL}{url}"
-        
         if not JINA_API_KEY:
             logger.error("JINA_API_KEY environment variable not found")
             return WebFetchResponse(
@@ -239,20 +825,29 @@ async def fetch_web_content(fetch_req: WebFetchRequest):
                 success=False,
                 message="Jina API密钥未配置，请检查环境变量"
             )
-        
-        headers = {'Authorization': f'Bearer {JINA_API_KEY}'}
 
         logger.info(f"Fetching web content from: {url}")
-        
-        response = requests.get(jina_url, headers=headers)
-        response.raise_for_status()  
-        
-        content = response.text
-        
+
+        content = await fetch_web(url, JINA_API_KEY)
+
         return WebFetchResponse(
             content=content,
             success=True
         )
+    except httpx.TimeoutException:
+        logger.error(f"获取网页内容超时: {fetch_req.url}")
+        return WebFetchResponse(
+            content="",
+            success=False,
+            message="获取网页内容超时，请稍后重试"
+        )
+    except WebFetchTooLarge as e:
+        logger.error(f"获取网页内容失败: {str(e)}")
+        return WebFetchResponse(
+            content="",
+            success=False,
+            message=str(e)
+        )
     except Exception as e:
         logger.error(f"获取网页内容失败: {str(e)}")
         return WebFetchResponse(
@@ -0,0 +1,164 @@
+import os
+import time
+import uuid
+import math
+import asyncio
+import logging
+from collections import OrderedDict
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+# 渲染 worker 数量默认与浏览器池大小一致，队列满时请求直接被拒绝
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.getenv("RENDER_POOL_SIZE", "2")))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "32"))
+RENDER_JOB_RETENTION = int(os.getenv("RENDER_JOB_RETENTION", "1000"))
+
+
+class RenderJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class RenderQueueFull(Exception):
+    """渲染队列已满，携带建议的重试等待秒数"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"render queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RenderJob:
+    def __init__(self, file_id: str, html_path: str, output_path: str | None, func=None, kind: str = "render"):
+        self.job_id = str(uuid.uuid4())
+        self.kind = kind
+        self.file_id = file_id
+        self.html_path = html_path
+        self.output_path = output_path
+        self.func = func
+        self.status = RenderJobStatus.QUEUED
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = asyncio.Event()
+
+    async def wait(self) -> "RenderJob":
+        """等待任务结束（成功或失败）"""
+        await self._done.wait()
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "file_id": self.file_id,
+            "status": self.status.value,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class RenderQueue:
+    """
+    有界的异步渲染队列，由固定数量的 worker 消费。
+
+    Args:
+        render_func: 同步渲染函数 render_func(html_path, output_path) -> bool，在线程中执行
+        workers: 并发渲染的 worker 数量
+        maxsize: 队列容量，超出时 submit 抛出 RenderQueueFull
+    """
+
+    def __init__(self, render_func, workers: int = RENDER_WORKERS, maxsize: int = RENDER_QUEUE_SIZE):
+        self.render_func = render_func
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.jobs: "OrderedDict[str, RenderJob]" = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+        self._avg_duration = 5.0  # 渲染耗时的滑动平均，用于估算 Retry-After
+
+    async def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"渲染队列已启动: {self.workers} 个worker, 容量 {self.queue.maxsize}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def submit(self, file_id: str, html_path: str, output_path: str) -> RenderJob:
+        return self._submit(RenderJob(file_id, html_path, output_path))
+
+    def submit_call(self, file_id: str, html_path: str, func, kind: str) -> RenderJob:
+        """
+        提交自定义的浏览器任务（如多格式导出），与渲染共用 worker 和队列容量。
+
+        func() 在线程中执行，返回值保存在 job.result，应尽量小（任务对象会保留到被淘汰），
+        调用方取走后可以清空；kind 用于和普通渲染任务区分。队列满时抛出 RenderQueueFull。
+        """
+        return self._submit(RenderJob(file_id, html_path, None, func=func, kind=kind))
+
+    def _submit(self, job: RenderJob) -> RenderJob:
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise RenderQueueFull(self.retry_after())
+        self.jobs[job.job_id] = job
+        self._prune()
+        return job
+
+    async def enqueue(self, file_id: str, html_path: str, output_path: str) -> RenderJob:
+        """与 submit 相同，但队列满时等待空位而不是拒绝（供批量任务使用）"""
+        job = RenderJob(file_id, html_path, output_path)
+        await self.queue.put(job)
+        self.jobs[job.job_id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> RenderJob | None:
+        return self.jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """按当前积压量和平均渲染耗时估算需要等待的秒数"""
+        backlog = self.queue.qsize() / self.workers
+        return max(1, math.ceil(backlog * self._avg_duration))
+
+    def _prune(self):
+        # 只淘汰已结束的任务，排队和运行中的任务始终保留
+        overflow = len(self.jobs) - RENDER_JOB_RETENTION
+        if overflow <= 0:
+            return
+        for job_id in [j.job_id for j in self.jobs.values() if j.finished_at][:overflow]:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            job.status = RenderJobStatus.RUNNING
+            job.started_at = time.time()
+            try:
+                if job.func is not None:
+                    job.result = await asyncio.to_thread(job.func)
+                    ok = True
+                else:
+                    ok = await asyncio.to_thread(self.render_func, job.html_path, job.output_path)
+                job.status = RenderJobStatus.DONE if ok else RenderJobStatus.FAILED
+                if not ok:
+                    job.error = "渲染失败"
+            except Exception as e:
+                logger.error(f"渲染任务 {job.job_id} 失败: {e}", exc_info=True)
+                job.status = RenderJobStatus.FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                duration = job.finished_at - job.started_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                job._done.set()
+                self.queue.task_done()
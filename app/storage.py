@@ -0,0 +1,243 @@
+import os
+import re
+import abc
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+
+from app.utils import cleanup_old_files
+
+logger = logging.getLogger(__name__)
+
+LEGACY_OUTPUT_DIR = "output"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(LEGACY_OUTPUT_DIR, "files"))
+STORAGE_INDEX_PATH = os.getenv("STORAGE_INDEX_PATH", os.path.join(LEGACY_OUTPUT_DIR, "storage_index.sqlite3"))
+# 最后一次访问超过 TTL 的卡片整组删除；总大小超过预算时按最久未访问淘汰。均为 0 表示不限制
+STORAGE_TTL_HOURS = float(os.getenv("STORAGE_TTL_HOURS", "168"))
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+STORAGE_EVICT_INTERVAL = float(os.getenv("STORAGE_EVICT_INTERVAL", "600"))
+
+# file_id 只允许 uuid 字符，路径参数中的 ../ 等无法越出存储目录
+_FILE_ID_RE = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+# 旧版平铺在 output/ 下的文件: {uuid}.html / {uuid}_prompt.txt / {uuid}.png
+_LEGACY_PATTERN = "*-*-*-*-*.*"
+
+
+class Storage(abc.ABC):
+    """
+    卡片产物的存储接口，按对象存储语义设计：对象键为 {分片}/{file_id}{后缀}。
+
+    同一张卡片的所有产物（HTML、提示词、PNG、导出文件）共用一个 file_id，
+    访问时间按 file_id 统计，淘汰时整组删除。渲染器和 FileResponse 需要本地文件，
+    远端后端（如 S3 兼容存储）应在 path / locate 中下载到本地缓存后返回路径。
+    """
+
+    @abc.abstractmethod
+    def write(self, file_id: str, suffix: str, data) -> str:
+        """写入一个产物（str 按 UTF-8 编码），返回本地路径"""
+
+    @abc.abstractmethod
+    def path(self, file_id: str, suffix: str) -> str:
+        """返回供外部程序（如渲染器）写入的本地路径，写完后调用 record"""
+
+    @abc.abstractmethod
+    def record(self, path: str) -> None:
+        """登记由外部程序写入 path 的产物"""
+
+    @abc.abstractmethod
+    def locate(self, file_id: str, suffix: str) -> str | None:
+        """返回已存在产物的本地路径并刷新访问时间，不存在时返回 None"""
+
+    @abc.abstractmethod
+    def delete(self, file_id: str) -> int:
+        """删除一张卡片的全部产物，返回删除的对象数"""
+
+    @abc.abstractmethod
+    def evict(self) -> dict:
+        """执行一次 TTL / 容量淘汰"""
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        """返回容量、对象数与淘汰统计"""
+
+
+class LocalStorage(Storage):
+    """
+    本地目录后端：按 file_id 哈希分两级子目录，元数据（大小、访问时间）记录在 SQLite 索引中。
+
+    Args:
+        root: 存储根目录
+        index_path: 元数据索引的 SQLite 文件
+        ttl_hours: 访问过期时间（小时），0 表示不按时间淘汰
+        max_bytes: 容量预算（字节），0 表示不限制
+        legacy_dir: 旧版平铺目录，读取时作为回退，淘汰时一并清理过期文件
+    """
+
+    def __init__(self, root: str = STORAGE_DIR, index_path: str = STORAGE_INDEX_PATH,
+                 ttl_hours: float = STORAGE_TTL_HOURS, max_bytes: int = STORAGE_MAX_BYTES,
+                 legacy_dir: str | None = LEGACY_OUTPUT_DIR):
+        self.root = root
+        self.ttl_hours = ttl_hours
+        self.max_bytes = max_bytes
+        self.legacy_dir = legacy_dir
+        self.evicted = 0
+        self.evicted_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        directory = os.path.dirname(index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "key TEXT PRIMARY KEY, file_id TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS objects_file_id ON objects (file_id)")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _check(file_id: str):
+        if not _FILE_ID_RE.match(file_id or ""):
+            raise ValueError(f"非法的 file_id: {file_id!r}")
+
+    def _key(self, file_id: str, suffix: str) -> str:
+        digest = hashlib.sha1(file_id.encode("utf-8")).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{file_id}{suffix}"
+
+    def path(self, file_id: str, suffix: str) -> str:
+        self._check(file_id)
+        path = os.path.join(self.root, self._key(file_id, suffix))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def write(self, file_id: str, suffix: str, data) -> str:
+        path = self.path(file_id, suffix)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._index(file_id, path, len(data))
+        return path
+
+    def record(self, path: str) -> None:
+        file_id = re.match(r"[A-Za-z0-9-]+", os.path.basename(path)).group(0)
+        self._index(file_id, path, os.path.getsize(path))
+
+    def _index(self, file_id: str, path: str, size: int):
+        key = os.path.relpath(path, self.root).replace(os.sep, "/")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO objects (key, file_id, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET size = excluded.size, accessed_at = excluded.accessed_at",
+                (key, file_id, size, now, now),
+            )
+            self._conn.execute("UPDATE objects SET accessed_at = ? WHERE file_id = ?", (now, file_id))
+
+    def locate(self, file_id: str, suffix: str) -> str | None:
+        if not _FILE_ID_RE.match(file_id or ""):
+            return None
+        path = os.path.join(self.root, self._key(file_id, suffix))
+        if os.path.exists(path):
+            with self._lock:
+                self._conn.execute("UPDATE objects SET accessed_at = ? WHERE file_id = ?", (time.time(), file_id))
+            return path
+        if self.legacy_dir:
+            legacy = os.path.join(self.legacy_dir, f"{file_id}{suffix}")
+            if os.path.exists(legacy):
+                return legacy
+        return None
+
+    def delete(self, file_id: str) -> int:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, size FROM objects WHERE file_id = ?", (file_id,)).fetchall()
+            self._conn.execute("DELETE FROM objects WHERE file_id = ?", (file_id,))
+        for key, size in rows:
+            try:
+                os.remove(os.path.join(self.root, key))
+            except FileNotFoundError:
+                pass
+            self.evicted_bytes += size
+        return len(rows)
+
+    def _groups(self):
+        """按最后访问时间从旧到新返回 [(file_id, 总大小, 最后访问时间)]"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT file_id, SUM(size), MAX(accessed_at) FROM objects GROUP BY file_id ORDER BY MAX(accessed_at)"
+            ).fetchall()
+
+    def evict(self) -> dict:
+        groups = self._groups()
+        total = sum(size for _, size, _ in groups)
+        cutoff = time.time() - self.ttl_hours * 3600 if self.ttl_hours > 0 else None
+        removed = []
+        for file_id, size, accessed_at in groups:
+            expired = cutoff is not None and accessed_at < cutoff
+            over_budget = self.max_bytes > 0 and total > self.max_bytes
+            if not expired and not over_budget:
+                break  # 按访问时间排序，后面的更新，不会再过期
+            self.delete(file_id)
+            total -= size
+            removed.append(file_id)
+        self.evicted += len(removed)
+        legacy_removed = 0
+        if self.legacy_dir and self.ttl_hours > 0:
+            legacy_removed = cleanup_old_files(self.legacy_dir, self.ttl_hours, pattern=_LEGACY_PATTERN)
+        if removed or legacy_removed:
+            logger.info(f"存储淘汰: {len(removed)} 张卡片, 旧版文件 {legacy_removed} 个, 剩余 {total} 字节")
+        return {"evicted": len(removed), "legacy_removed": legacy_removed, "bytes": total}
+
+    def stats(self) -> dict:
+        with self._lock:
+            objects, total, file_ids = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COUNT(DISTINCT file_id) FROM objects"
+            ).fetchone()
+        return {
+            "backend": "local",
+            "objects": objects,
+            "cards": file_ids,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_hours": self.ttl_hours,
+            "evicted": self.evicted,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+async def run_eviction_loop(storage: Storage, interval: float = STORAGE_EVICT_INTERVAL):
+    """后台定期淘汰（由 FastAPI lifespan 启动，关闭时取消）"""
+    while True:
+        try:
+            await asyncio.to_thread(storage.evict)
+        except Exception as e:
+            logger.error(f"存储淘汰失败: {e}", exc_info=True)
+        await asyncio.sleep(interval)
+
+
+_default_storage = None
+_default_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """获取进程内共享的存储后端（懒加载，由 STORAGE_BACKEND 选择）"""
+    global _default_storage
+    with _default_storage_lock:
+        if _default_storage is None:
+            if STORAGE_BACKEND != "local":
+                raise ValueError(f"不支持的存储后端: {STORAGE_BACKEND}")
+            _default_storage = LocalStorage()
+        return _default_storage
@@ -1,7 +1,21 @@
 import os
+import time
+import fnmatch
 import shutil
 
-def cleanup_old_files(directory: str, max_age_hours: int = 24):
-    """清理旧文件"""
-    # 实现可以根据需要添加
-    pass
\ No newline at end of file
+def cleanup_old_files(directory: str, max_age_hours: int = 24, pattern: str = "*") -> int:
+    """清理目录下（不递归）修改时间超过 max_age_hours 小时、文件名匹配 pattern 的文件，返回删除数量"""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in os.scandir(directory):
+        if not entry.is_file(follow_symlinks=False) or not fnmatch.fnmatch(entry.name, pattern):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
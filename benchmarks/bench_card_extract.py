@@ -0,0 +1,109 @@
+"""
+卡片提取的耗时与峰值内存对比：原图检测 vs 缩小副本检测。
+
+默认用浏览器池把 game_card/*.html 渲染成 3x DPR 截图（缓存在 output/.bench_screenshots），
+也可以用 --images 直接指定截图。每个 (截图, 模式) 在独立的 spawn 子进程中运行，
+峰值内存取子进程解码截图之后 ru_maxrss 的增量（Linux 下单位为 KB）。
+同时输出两种模式裁剪出的边界框，便于确认结果一致。
+
+运行方式（仓库根目录）:
+    python benchmarks/bench_card_extract.py
+    python benchmarks/bench_card_extract.py --images output/*.png --detect-width 600
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import resource
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import cv2  # noqa: E402
+
+from tools.card_extractor import CARD_DETECT_WIDTH, extract_card_from_array  # noqa: E402
+
+SCREENSHOT_DIR = os.path.join("output", ".bench_screenshots")
+
+
+def render_samples(pattern):
+    """把 HTML 样例渲染成截图，已渲染过的直接复用"""
+    from tools.selenium2img import html_to_image
+    from tools.browser_pool import shutdown_browser_pool
+
+    os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+    images = []
+    try:
+        for html_path in sorted(glob.glob(pattern)):
+            name = os.path.splitext(os.path.basename(html_path))[0].replace(" ", "_")
+            image_path = os.path.join(SCREENSHOT_DIR, f"{name}.png")
+            if os.path.exists(image_path) or html_to_image(html_path, image_path):
+                images.append(image_path)
+    finally:
+        shutdown_browser_pool()
+    return images
+
+
+def _card_box(img, card):
+    """由裁剪结果（原图的视图）反推边界框 (x, y, w, h)"""
+    offset = card.ctypes.data - img.ctypes.data
+    y, rest = divmod(offset, img.strides[0])
+    return (rest // img.strides[1], y, card.shape[1], card.shape[0])
+
+
+def _measure(image_path, detect_width, repeat, results):
+    img = cv2.imread(image_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        card, found = extract_card_from_array(img, detect_width=detect_width)
+        timings.append(time.perf_counter() - start)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    box = _card_box(img, card) if found else None
+    results.put((img.shape[1], img.shape[0], min(timings), sum(timings) / len(timings), peak, box))
+
+
+def measure(image_path, detect_width, repeat):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(image_path, detect_width, repeat, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--html", default=os.path.join("game_card", "*.html"), help="要渲染的 HTML 样例")
+    parser.add_argument("--images", nargs="*", help="直接使用这些截图，跳过渲染")
+    parser.add_argument("--detect-width", type=int, default=CARD_DETECT_WIDTH or 600)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    images = args.images or render_samples(args.html)
+    if not images:
+        sys.exit("没有可用的截图：请安装 Chrome 渲染样例，或用 --images 指定截图")
+
+    modes = [("full", 0), (f"detect@{args.detect_width}", args.detect_width)]
+    print(f"{'image':<28}{'size':>12}{'mode':>14}{'best ms':>10}{'mean ms':>10}{'peak MB':>10}  box")
+    totals = {name: [0.0, 0] for name, _ in modes}
+    for image_path in images:
+        for name, detect_width in modes:
+            w, h, best, mean, peak, box = measure(image_path, detect_width, args.repeat)
+            totals[name][0] += best
+            totals[name][1] = max(totals[name][1], peak)
+            print(f"{os.path.basename(image_path)[:27]:<28}{f'{w}x{h}':>12}{name:>14}"
+                  f"{best * 1000:>10.1f}{mean * 1000:>10.1f}{peak / 1024:>10.1f}  {box}")
+
+    print()
+    full_time = totals["full"][0]
+    for name, (total, peak) in totals.items():
+        speedup = full_time / total if total else float("inf")
+        print(f"{name:<16} 总耗时 {total * 1000:.1f} ms ({speedup:.2f}x), 最大峰值内存增量 {peak / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+端到端基准测试：在本地模拟 LLM 之上启动 app.main:app，按固定并发压测主要接口。
+
+场景:
+    generate_prompt   POST /api/generate (mode=prompt)，每个请求的 prompt 不同，不命中缓存与合并
+    generate_paste    POST /api/generate (mode=paste)，HTML 取自 game_card/test_*.html
+    summarize         POST /api/summarize
+    render            先以 paste 模式生成，再 POST /api/render-image 并轮询任务直到结束（需要 Chrome）
+
+每个 (场景, 并发) 报告吞吐、p50/p95/p99 延迟、错误数，以及服务进程树（含 Chrome、
+卡片提取进程池）的 RSS。服务在临时目录中运行，output/ 和各类缓存都不会写进仓库。
+
+运行方式（仓库根目录）:
+    python benchmarks/bench_e2e.py
+    python benchmarks/bench_e2e.py --concurrency 1 8 32 --requests 64 --llm-latency 1.0 --llm-tokens-per-sec 300
+    python benchmarks/bench_e2e.py --scenarios render --concurrency 1 2 4 --json result.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCENARIOS = ("generate_prompt", "generate_paste", "summarize", "render")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_http(url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程提前退出: {' '.join(process.args)}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise TimeoutError(f"等待 {url} 超时")
+
+
+def _tree_rss_kb(pid):
+    """进程及其所有子孙进程的 RSS 之和（KB，读取 /proc，仅 Linux）"""
+    children = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat_path.split("/")[2]))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+        stack.extend(children.get(current, []))
+    return total
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def load_corpus():
+    paths = sorted(glob.glob(os.path.join(ROOT, "game_card", "test_*.html")))
+    corpus = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+class Bench:
+    def __init__(self, base_url, corpus, render_timeout):
+        self.base_url = base_url
+        self.corpus = corpus
+        self.render_timeout = render_timeout
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=600.0,
+                                        limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+
+    def _html(self, i):
+        # 追加唯一注释，避免渲染缓存命中
+        return self.corpus[i % len(self.corpus)] + f"\n<!-- bench {uuid.uuid4()} -->"
+
+    async def _post(self, path, payload):
+        response = await self.client.post(path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def generate_prompt(self, i):
+        await self._post("/api/generate", {"mode": "prompt", "prompt": f"生成一张游戏卡片 #{i} {uuid.uuid4()}"})
+
+    async def generate_paste(self, i):
+        await self._post("/api/generate", {"mode": "paste", "html_input": self._html(i)})
+
+    async def summarize(self, i):
+        await self._post("/api/summarize", {"content": f"第 {i} 段待总结的内容 {uuid.uuid4()}。" * 20})
+
+    async def render(self, i):
+        file_id = (await self._post("/api/generate", {"mode": "paste", "html_input": self._html(i)}))["file_id"]
+        while True:
+            response = await self.client.post(f"/api/render-image/{file_id}")
+            if response.status_code != 429:
+                break
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        response.raise_for_status()
+        job = response.json()
+        deadline = time.monotonic() + self.render_timeout
+        while job["status"] in ("queued", "running"):
+            if time.monotonic() > deadline:
+                raise TimeoutError("渲染超时")
+            await asyncio.sleep(0.05)
+            job = (await self.client.get(job["status_url"])).json()
+        if job["status"] != "done":
+            raise RuntimeError(job.get("error") or "渲染失败")
+
+    async def run(self, scenario, concurrency, requests, pid):
+        func = getattr(self, scenario)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], []
+        peak_rss = _tree_rss_kb(pid)
+
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await func(i)
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+        async def sample_memory():
+            nonlocal peak_rss
+            while True:
+                peak_rss = max(peak_rss, _tree_rss_kb(pid))
+                await asyncio.sleep(0.25)
+
+        sampler = asyncio.create_task(sample_memory())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+        ordered = sorted(latencies)
+        return {
+            "scenario": scenario,
+            "concurrency": concurrency,
+            "requests": requests,
+            "ok": len(latencies),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50": _percentile(ordered, 0.50),
+            "p95": _percentile(ordered, 0.95),
+            "p99": _percentile(ordered, 0.99),
+            "peak_rss_mb": peak_rss / 1024,
+        }
+
+
+def _print_result(r):
+    def ms(v):
+        return f"{v * 1000:9.1f}" if v is not None else f"{'-':>9}"
+
+    print(f"{r['scenario']:<16}{r['concurrency']:>5}{r['ok']:>6}/{r['requests']:<5}{r['errors']:>5}"
+          f"{r['throughput']:>10.2f}{ms(r['p50'])}{ms(r['p95'])}{ms(r['p99'])}{r['peak_rss_mb']:>10.1f}")
+    if r["first_error"]:
+        print(f"    首个错误: {r['first_error'][:200]}")
+
+
+def start_services(args, workdir):
+    # 服务日志默认丢弃，避免淹没结果表；--verbose 时照常输出
+    log = None if args.verbose else subprocess.DEVNULL
+    llm_port, app_port = _free_port(), _free_port()
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "mock_llm.py"), "--port", str(llm_port),
+        "--latency", str(args.llm_latency), "--tokens-per-sec", str(args.llm_tokens_per_sec),
+    ], stdout=log, stderr=subprocess.STDOUT)
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "ARK_API_KEY": "mock",
+        "ARK_BASE_URL": f"{llm_url}/v1",
+        "DEEPSEEK_API_KEY": "mock",
+        "DEEPSEEK_API_URL": f"{llm_url}/v1/chat/completions",
+        # 每个请求都要真正走到模型，关闭响应缓存
+        "LLM_CACHE_BACKEND": "",
+        # 渲染不访问外网，结果可复现
+        "RENDER_ASSET_MODE": "offline",
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        _wait_http(f"{llm_url}/stats", mock)
+        _wait_http(f"http://127.0.0.1:{app_port}/metrics", app)
+    except Exception:
+        stop_services(mock, app)
+        raise
+    return mock, app, f"http://127.0.0.1:{app_port}"
+
+
+def stop_services(*processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_all(args, base_url, pid):
+    bench = Bench(base_url, load_corpus(), args.render_timeout)
+    results = []
+    try:
+        print(f"{'scenario':<16}{'conc':>5}{'ok':>6}{'':<6}{'err':>5}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>10}")
+        for scenario in args.scenarios:
+            if args.warmup:
+                await bench.run(scenario, 1, args.warmup, pid)
+            for concurrency in args.concurrency:
+                result = await bench.run(scenario, concurrency, args.requests, pid)
+                results.append(result)
+                _print_result(result)
+                if scenario == "render" and result["ok"] == 0:
+                    print("    渲染全部失败（是否已安装 Chrome？），跳过更高并发")
+                    break
+    finally:
+        await bench.client.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试（本地模拟 LLM）")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="每个 (场景, 并发) 的请求数")
+    parser.add_argument("--warmup", type=int, default=2, help="每个场景开始前的预热请求数")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="模拟 LLM 首 token 延迟（秒）")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=200.0, help="模拟 LLM 输出速率，0 表示不限速")
+    parser.add_argument("--render-timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="把结果另存为 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="输出服务端日志")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as workdir:
+        mock, app, base_url = start_services(args, workdir)
+        try:
+            results = asyncio.run(run_all(args, base_url, app.pid))
+        finally:
+            stop_services(app, mock)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
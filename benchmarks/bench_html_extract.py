@@ -0,0 +1,124 @@
+"""
+HTML 提取的回归对比与微基准。
+
+先在回归语料和随机生成的输入上确认 extract_html 与原正则级联的结果完全一致，
+再在约 200KB 的畸形输入上对比两者耗时。
+
+原正则在部分输入上需要数十秒乃至数分钟，完整运行耗时较长。
+
+运行方式（仓库根目录）:
+    python benchmarks/bench_html_extract.py
+"""
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tools.html_extractor import extract_html, HtmlStreamExtractor  # noqa: E402
+
+
+def legacy_extract(response_text):
+    """原先 extract_html_from_response 的正则级联实现，作为对照"""
+    html_pattern = r'(?:<!DOCTYPE\s+html[^>]*>|<html[^>]*>)[\s\S]*?</html>'
+    match = re.search(html_pattern, response_text, re.IGNORECASE)
+    if match:
+        return match.group(0)
+    code_block_pattern = r'```(?:html)?\s*((?:<!DOCTYPE\s+html[^>]*>|<html[^>]*>)[\s\S]*?</html>)\s*```'
+    match = re.search(code_block_pattern, response_text, re.IGNORECASE)
+    if match:
+        return match.group(1)
+    html_fragment_pattern = r'<[^>]+>[\s\S]*?</[^>]+>'
+    match = re.search(html_fragment_pattern, response_text)
+    if match:
+        return match.group(0)
+    return response_text
+
+
+CORPUS = [
+    "",
+    "没有任何HTML的纯文本回答",
+    "<!DOCTYPE html><html><body>hi</body></html>",
+    "好的，下面是代码：\n```html\n<!DOCTYPE html>\n<html lang=\"zh\">\n<head></head>\n<body></body>\n</html>\n```\n希望有帮助",
+    "```\n<html><body>x</body></HTML>\n```",
+    "<!doctype  HTML><HTML><body>a</body></Html> trailing </html>",
+    "<!DOCTYPEhtml><html>x</html>",
+    "<!DOCTYPE html without close",
+    "<html lang=en",
+    "<div class=\"card\"><p>片段</p></div>",
+    "<br/> text </>  </p>",
+    "<> <a>b</>c</d>",
+    "a < b and c > d </e>",
+    "<!DOCTYPE xml><html>ok</html>",
+    "<htmlx>weird</html>",
+    "</html><html>late</html>",
+    "<div>\n<!DOCTYPE html>\n</div>",
+    "<<<>>></x>",
+    "<a></",
+    "<a></b",
+]
+
+# 约 200KB 的畸形输入，正则在这些输入上会大量回溯
+PATHOLOGICAL = {
+    "unclosed_tags": "<a " * 70000,
+    "open_then_slashes": "<a>" + "</" * 100000,
+    "many_html_no_close": "<html>" * 35000,
+    "doctype_whitespace": "<!DOCTYPE" + " " * 200000,
+    "angle_soup": "<>" * 100000,
+}
+
+
+def random_input(rng, length):
+    alphabet = ["<", ">", "/", "</", "<html>", "</html>", "<!DOCTYPE html>", "<!doctype ", " ", "\n", "a", "```html", "```", "HTML", "p"]
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def stream_extract(text, rng):
+    """把文本随机切块喂给流式提取器"""
+    extractor = HtmlStreamExtractor()
+    out, pos = [], 0
+    while pos < len(text):
+        step = rng.randint(1, 8)
+        out.append(extractor.feed(text[pos:pos + step]))
+        pos += step
+    return "".join(out), extractor.finished
+
+
+def check_regression():
+    rng = random.Random(0)
+    samples = CORPUS + [random_input(rng, rng.randint(0, 40)) for _ in range(20000)]
+    for text in samples:
+        expected = legacy_extract(text)
+        actual = extract_html(text)
+        assert actual == expected, f"mismatch on {text!r}: {actual!r} != {expected!r}"
+        # 流式提取器找到完整文档时，应与整体提取结果一致
+        streamed, finished = stream_extract(text, rng)
+        if finished:
+            assert streamed == expected, f"stream mismatch on {text!r}: {streamed!r} != {expected!r}"
+    print(f"回归检查通过: {len(samples)} 个输入结果一致")
+
+
+def timed(func, text, budget):
+    start = time.perf_counter()
+    runs = 0
+    while True:
+        func(text)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / runs
+
+
+def run_benchmark(budget=0.5):
+    print(f"{'input':<22}{'size':>10}{'regex (ms)':>14}{'scanner (ms)':>15}{'speedup':>10}")
+    for name, text in PATHOLOGICAL.items():
+        legacy = timed(legacy_extract, text, budget)
+        scanner = timed(extract_html, text, budget)
+        print(f"{name:<22}{len(text):>10}{legacy * 1000:>14.2f}{scanner * 1000:>15.3f}{legacy / scanner:>9.0f}x")
+
+
+if __name__ == "__main__":
+    check_regression()
+    run_benchmark()
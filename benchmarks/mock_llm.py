@@ -0,0 +1,114 @@
+"""
+本地模拟的 OpenAI 兼容 chat-completions 接口，供端到端基准测试替代 Ark / DeepSeek。
+
+支持普通与流式 (stream=True) 两种响应。回复内容取自 game_card/ 下的 HTML 样例，
+包在 ```html 代码块里，和真实模型的输出形态一致。延迟由两部分组成:
+    --latency          首个 token 之前的固定等待（秒）
+    --tokens-per-sec   之后按此速率输出（约 4 个字符算一个 token，0 表示不限速）
+
+运行方式（仓库根目录）:
+    python benchmarks/mock_llm.py --port 18080 --latency 0.5 --tokens-per-sec 200
+接口地址: http://127.0.0.1:18080/v1/chat/completions
+"""
+import os
+import json
+import glob
+import time
+import asyncio
+import argparse
+import itertools
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_TOKENS = 4
+
+app = FastAPI()
+app.state.latency = 0.0
+app.state.tokens_per_sec = 0.0
+app.state.requests = 0
+
+_CORPUS_DIR = os.path.join(os.path.dirname(__file__), "..", "game_card")
+_corpus = []
+_next_sample = None
+
+
+def _load_corpus():
+    global _next_sample
+    for path in sorted(glob.glob(os.path.join(_CORPUS_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            _corpus.append(f.read())
+    if not _corpus:
+        _corpus.append("<!DOCTYPE html><html><body><div class=\"card\">mock</div></body></html>")
+    _next_sample = itertools.cycle(_corpus)
+
+
+def _reply(body):
+    messages = body.get("messages") or []
+    prompt = messages[-1].get("content", "") if messages else ""
+    if "总结" in prompt:
+        return "## 总结\n\n- 这是模拟的总结内容。\n- 用于基准测试。\n"
+    return "好的，下面是卡片代码：\n```html\n" + next(_next_sample) + "\n```\n"
+
+
+def _generation_seconds(text):
+    rate = app.state.tokens_per_sec
+    return len(text) / CHARS_PER_TOKEN / rate if rate > 0 else 0.0
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    content = _reply(body)
+    model = body.get("model", "mock")
+    created = int(time.time())
+    await asyncio.sleep(app.state.latency)
+
+    if body.get("stream"):
+        step = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+
+        async def events():
+            for i in range(0, len(content), step):
+                piece = content[i:i + step]
+                chunk = {
+                    "id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(_generation_seconds(piece))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(_generation_seconds(content))
+    tokens = len(content) // CHARS_PER_TOKEN
+    return {
+        "id": "mock", "object": "chat.completion", "created": created, "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return {"requests": app.state.requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 chat-completions 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.5, help="首个 token 前的等待秒数")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="输出速率，0 表示不限速")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.tokens_per_sec = args.tokens_per_sec
+    _load_corpus()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
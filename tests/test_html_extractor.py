@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from tools.html_extractor import HtmlStreamExtractor, extract_html
+
+_RESPONSES = [
+    "说明文字\n```html\n<!DOCTYPE html>\n<html><body><p>卡片</p></body></html>\n```\n后记",
+    "前言 <!doctype  HTML><html lang='zh'><head></head><body>x</body></HTML> 尾巴",
+    "no doctype <html><body><div>a</div></body></html> trailing </html>",
+    "<!DOCTYPE notehtml> 之后 <html><body>y</body></html>",
+]
+
+
+@pytest.mark.parametrize("response", _RESPONSES)
+def test_extract_full_document(response):
+    html = extract_html(response)
+    assert html.lower().startswith(("<!doctype", "<html"))
+    assert html.lower().endswith("</html>")
+    assert html.lower().count("</html>") == 1
+
+
+def test_extract_fragment_and_plain_text():
+    assert extract_html("看这里 <div class='c'>内容</div> 完") == "<div class='c'>内容</div>"
+    assert extract_html("没有任何标签") == "没有任何标签"
+
+
+@pytest.mark.parametrize("response", _RESPONSES)
+def test_stream_matches_full_extraction_for_any_chunking(response):
+    rng = random.Random(len(response))
+    for _ in range(50):
+        extractor = HtmlStreamExtractor()
+        pieces, pos = [], 0
+        while pos < len(response):
+            size = rng.randint(1, 8)
+            pieces.append(extractor.feed(response[pos:pos + size]))
+            pos += size
+        assert "".join(pieces) == extract_html(response)
+        assert extractor.finished
+
+
+def test_stream_without_html_yields_nothing():
+    extractor = HtmlStreamExtractor()
+    assert extractor.feed("只是普通文本 <b") == ""
+    assert extractor.feed("r>") == ""
+    assert not extractor.started
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from app.job_store import IdempotencyConflict, JobStatus, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_idempotency_key(store):
+    job, created = store.create("generate", {"a": 1}, "key")
+    again, created_again = store.create("generate", {"a": 1}, "key")
+    assert created and not created_again
+    assert again.job_id == job.job_id
+    with pytest.raises(IdempotencyConflict):
+        store.create("generate", {"a": 2}, "key")
+
+
+def test_concurrent_claims_are_exclusive(store):
+    for i in range(20):
+        store.create("generate", {"i": i})
+    claimed, lock = [], threading.Lock()
+
+    def worker(n):
+        while (job := store.claim(f"w{n}", ["generate"])) is not None:
+            with lock:
+                claimed.append(job.job_id)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == len(set(claimed)) == 20
+
+
+def test_claim_only_matching_kinds(store):
+    store.create("other", {})
+    assert store.claim("w", ["generate"]) is None
+
+
+def test_cancel_queued_and_running(store):
+    queued, _ = store.create("generate", {"n": 1})
+    assert store.request_cancel(queued.job_id).status == JobStatus.CANCELLED
+    running, _ = store.create("generate", {"n": 2})
+    store.claim("w", ["generate"])
+    job = store.request_cancel(running.job_id)
+    assert job.status == JobStatus.RUNNING and job.cancel_requested
+    assert store.heartbeat([running.job_id]) == {running.job_id}
+
+
+def test_requeue_stale_requeues_then_fails(store):
+    job, _ = store.create("generate", {})
+    store.claim("w", ["generate"])
+    assert store.requeue_stale(60) == 0  # 心跳未超时
+    assert store.requeue_stale(-1, max_attempts=2) == 1
+    assert store.get(job.job_id).status == JobStatus.QUEUED
+    store.claim("w", ["generate"])
+    assert store.requeue_stale(-1, max_attempts=2) == 0
+    assert store.get(job.job_id).status == JobStatus.FAILED
+
+
+def test_requeue_stale_cancels_cancel_requested(store):
+    job, _ = store.create("generate", {})
+    store.claim("w", ["generate"])
+    store.request_cancel(job.job_id)
+    store.requeue_stale(-1)
+    assert store.get(job.job_id).status == JobStatus.CANCELLED
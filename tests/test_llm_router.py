@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from tools import llm_router
+from tools.llm_router import LLMRouter, Provider, UpstreamError, _is_retryable
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(llm_router, "LLM_MAX_RETRIES", 2)
+
+
+def _provider(name, call=None, stream=None):
+    return Provider(name, call, f"{name}-model", max_concurrency=2, rate=0, burst=1, stream=stream)
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (UpstreamError(status_code=429), True),
+    (UpstreamError(status_code=503), True),
+    (UpstreamError(status_code=400), False),
+    (HTTPException(status_code=504), False),  # 超时不重试
+    (HTTPException(status_code=500), False),  # 本地/连接错误不重试
+    (RuntimeError("boom"), False),
+])
+def test_is_retryable(exc, expected):
+    assert _is_retryable(exc) is expected
+
+
+def test_retries_then_succeeds():
+    attempts = []
+
+    async def call(prompt, model, temperature, sys_prompt):
+        attempts.append(model)
+        if len(attempts) < 3:
+            raise UpstreamError(status_code=429)
+        return "ok"
+
+    router = LLMRouter([_provider("a", call)])
+    assert asyncio.run(router.generate("p", None, 0.7)) == "ok"
+    assert attempts == ["a-model"] * 3
+    assert router.providers[0].retries == 2
+
+
+def test_fails_over_with_fallback_default_model():
+    async def down(prompt, model, temperature, sys_prompt):
+        raise UpstreamError(status_code=503)
+
+    async def up(prompt, model, temperature, sys_prompt):
+        return model
+
+    router = LLMRouter([_provider("a", down), _provider("b", up)])
+    assert asyncio.run(router.generate("p", "custom", 0.7)) == "b-model"
+    assert router.failovers == 1
+
+
+def test_timeout_is_neither_retried_nor_failed_over():
+    attempts = []
+
+    async def hung(prompt, model, temperature, sys_prompt):
+        attempts.append(1)
+        raise HTTPException(status_code=504)
+
+    async def up(prompt, model, temperature, sys_prompt):
+        return "unused"
+
+    router = LLMRouter([_provider("a", hung), _provider("b", up)])
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(router.generate("p", None, 0.7))
+    assert info.value.status_code == 504
+    assert attempts == [1]
+    assert router.failovers == 0
+
+
+def _collect(router):
+    async def main():
+        return [chunk async for chunk in router.stream("p", None, 0.7)]
+    return asyncio.run(main())
+
+
+def test_stream_fails_over_before_first_chunk():
+    async def throttled(prompt, model, temperature, sys_prompt):
+        raise UpstreamError(status_code=429)
+        yield  # pragma: no cover
+
+    async def whole(prompt, model, temperature, sys_prompt):
+        return "whole"
+
+    router = LLMRouter([_provider("a", stream=throttled), _provider("b", whole)])
+    assert _collect(router) == ["whole"]
+    assert router.failovers == 1
+
+
+def test_stream_error_after_first_chunk_is_raised():
+    async def partial(prompt, model, temperature, sys_prompt):
+        yield "a"
+        raise UpstreamError(status_code=503)
+
+    async def whole(prompt, model, temperature, sys_prompt):
+        return "whole"
+
+    router = LLMRouter([_provider("a", stream=partial), _provider("b", whole)])
+    with pytest.raises(UpstreamError):
+        _collect(router)
+    assert router.failovers == 0
+    assert router.providers[0].in_flight == 0
@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+from app.storage import LocalStorage, Storage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(root=str(tmp_path / "files"), index_path=str(tmp_path / "index.sqlite3"),
+                        ttl_hours=1, max_bytes=0, legacy_dir=str(tmp_path / "legacy"))
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_write_and_locate(storage):
+    path = storage.write("abc-1", ".html", "<p>hi</p>")
+    assert storage.locate("abc-1", ".html") == path
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "<p>hi</p>"
+    assert storage.locate("abc-1", ".png") is None
+
+
+@pytest.mark.parametrize("file_id", ["../etc", "a/b", "", "x" * 65])
+def test_invalid_file_ids(storage, file_id):
+    assert storage.locate(file_id, ".html") is None
+    with pytest.raises(ValueError):
+        storage.write(file_id, ".html", "x")
+
+
+def test_legacy_fallback(storage, tmp_path):
+    os.makedirs(tmp_path / "legacy")
+    legacy = tmp_path / "legacy" / "old-1.html"
+    legacy.write_text("old", encoding="utf-8")
+    assert storage.locate("old-1", ".html") == str(legacy)
+
+
+def test_evicts_whole_cards_least_recently_used_first(storage):
+    storage.max_bytes = 250
+    for file_id in ("card-1", "card-2", "card-3"):
+        storage.write(file_id, ".html", "x" * 60)
+        storage.write(file_id, ".png", b"y" * 60)
+        time.sleep(0.01)
+    storage.locate("card-1", ".html")  # 刷新访问时间，card-2 变成最久未访问
+    result = storage.evict()
+    assert result == {"evicted": 1, "legacy_removed": 0, "bytes": 240}
+    assert storage.locate("card-2", ".html") is None
+    assert storage.locate("card-2", ".png") is None
+    assert storage.locate("card-1", ".png") is not None
+
+
+def test_evicts_expired_cards(storage):
+    storage.write("stale-1", ".html", "x")
+    storage.write("fresh-1", ".html", "x")
+    storage._conn.execute("UPDATE objects SET accessed_at = ? WHERE file_id = 'stale-1'", (time.time() - 7200,))
+    assert storage.evict()["evicted"] == 1
+    assert storage.locate("stale-1", ".html") is None
+    assert storage.locate("fresh-1", ".html") is not None
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from tools.summarizer import estimate_tokens, split_markdown
+
+_WORDS = ["alpha", "测试", "数据", "beta", "gamma。", "delta.", "中文句子！", "x" * 50, "长" * 40]
+
+
+def _document(rng):
+    parts = []
+    for _ in range(20):
+        parts.append("#" * rng.randint(1, 3) + " 标题 heading " + " ".join(rng.choices(_WORDS, k=rng.randint(1, 6))))
+        for _ in range(rng.randint(0, 4)):
+            parts.append(" ".join(rng.choices(_WORDS, k=rng.randint(1, 120))))
+        if rng.random() < 0.2:
+            parts.append("无标点" * 300 + "abc" * 200)
+    return "\n\n".join(parts)
+
+
+@pytest.mark.parametrize("budget", [20, 50, 300, 3000])
+def test_chunks_never_exceed_budget(budget):
+    rng = random.Random(budget)
+    for _ in range(10):
+        chunks = split_markdown(_document(rng), budget)
+        assert chunks
+        assert max(estimate_tokens(chunk) for chunk in chunks) <= budget
+
+
+def test_split_section_repeats_heading():
+    chunks = split_markdown("# 标题\n\n" + "段落。" * 10, 12)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("# 标题\n\n") for chunk in chunks)
+
+
+def test_short_text_is_one_chunk():
+    assert split_markdown("# T\n\nhello", 100) == ["# T\n\nhello"]
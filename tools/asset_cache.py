@@ -0,0 +1,376 @@
+"""
+渲染用静态资源（字体、CSS、脚本、图标）的本地缓存与请求拦截。
+
+浏览器池中的每个标签页都通过 CDP Fetch 域拦截子资源请求:
+    - 缓存命中: 直接用磁盘上的内容应答，不走网络
+    - 未命中且主机在白名单内 (cache 模式): 由服务端抓取、写入缓存后应答
+    - 其余请求: 立即以 BlockedByClient 失败，不等网络超时
+本地文件、data: 等非网络请求以及标签页的顶层文档照常放行；iframe 等子框架文档按子资源处理。
+
+RENDER_ASSET_MODE:
+    off      不拦截，与原先行为一致
+    cache    命中走缓存，白名单主机回源并缓存，其余拦截（默认）
+    offline  只用缓存，未命中一律拦截，渲染结果完全不依赖网络
+
+预先填充缓存（仓库根目录）:
+    python -m tools.asset_cache https://fonts.googleapis.com/css2?family=Noto+Sans+SC https://cdn.tailwindcss.com
+    python -m tools.asset_cache --file asset_urls.txt
+"""
+import os
+import re
+import json
+import base64
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+import websocket
+
+logger = logging.getLogger(__name__)
+
+RENDER_ASSET_MODE = os.getenv("RENDER_ASSET_MODE", "cache").lower()
+RENDER_ASSET_CACHE_DIR = os.getenv("RENDER_ASSET_CACHE_DIR", os.path.join("output", ".asset_cache"))
+RENDER_ASSET_CACHE_MAX_BYTES = int(os.getenv("RENDER_ASSET_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RENDER_ASSET_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv(
+    "RENDER_ASSET_ALLOWED_HOSTS",
+    "fonts.googleapis.com,fonts.gstatic.com,cdn.tailwindcss.com,cdn.jsdelivr.net,"
+    "cdnjs.cloudflare.com,unpkg.com,use.fontawesome.com",
+).split(",") if h.strip()]
+RENDER_ASSET_FETCH_TIMEOUT = float(os.getenv("RENDER_ASSET_FETCH_TIMEOUT", "5"))
+RENDER_ASSET_FETCH_WORKERS = int(os.getenv("RENDER_ASSET_FETCH_WORKERS", "4"))
+
+# 应答时保留的响应头；字体跨域加载需要 CORS 头，统一补上
+_KEPT_HEADERS = ("content-type", "cache-control")
+_PASS_THROUGH_SCHEMES = ("file", "data", "blob", "about", "chrome", "devtools")
+_CSS_URL_RE = re.compile(r"url\(\s*['\"]?([^'\")]+)['\"]?\s*\)")
+
+
+class AssetCache:
+    """
+    按 URL 寻址的磁盘资源缓存，每个条目是 {hash}.bin（响应体）和 {hash}.json（状态码与响应头）。
+
+    写入先落到临时文件再 os.replace，并发读取不会看到半写入的文件。
+    总大小超过 max_bytes 时淘汰最久未使用的条目（与渲染缓存相同的 LRU 策略）。
+    """
+
+    def __init__(self, cache_dir=RENDER_ASSET_CACHE_DIR, max_bytes=RENDER_ASSET_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.blocked = 0
+        # 多个标签页的拦截线程会同时读写计数器和 LRU 索引
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # hash -> 条目大小，按最近使用排序
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _load_index(self):
+        """启动时按元数据文件的 mtime 重建 LRU 顺序"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                mtime = os.stat(self._path(key, ".json")).st_mtime
+                size = os.path.getsize(self._path(key, ".json")) + os.path.getsize(self._path(key, ".bin"))
+            except OSError:
+                continue
+            entries.append((mtime, key, size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def count(self, counter):
+        """计数器加一（hits / misses / fetched / blocked）"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, url):
+        """命中时返回 (状态码, 响应头字典, 响应体字节)，否则返回 None"""
+        key = self._key(url)
+        try:
+            with open(self._path(key, ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._path(key, ".bin"), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            self.count("misses")
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key, ".json"))  # 让重启后的 LRU 顺序也正确
+        except OSError:
+            pass
+        return meta["status"], meta["headers"], body
+
+    def put(self, url, status, headers, body):
+        """写入一个条目；响应体先于元数据落盘，元数据存在即代表条目完整"""
+        key = self._key(url)
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() in _KEPT_HEADERS}
+        meta = json.dumps({"url": url, "status": status, "headers": headers}, ensure_ascii=False).encode("utf-8")
+        self._write(self._path(key, ".bin"), body)
+        self._write(self._path(key, ".json"), meta)
+        self._record(key, len(body) + len(meta))
+
+    def _record(self, key, size):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size
+            evicted = []
+            while self.max_bytes > 0 and self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            # 先删元数据，读者随即视为未命中
+            for suffix in (".json", ".bin"):
+                try:
+                    os.remove(self._path(old_key, suffix))
+                except OSError:
+                    pass
+        if evicted:
+            logger.info(f"资源缓存淘汰 {len(evicted)} 个条目")
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": RENDER_ASSET_MODE,
+                "hits": self.hits,
+                "misses": self.misses,
+                "fetched": self.fetched,
+                "blocked": self.blocked,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def is_allowed_host(url):
+    host = (urlsplit(url).hostname or "").lower()
+    return any(host == allowed or host.endswith("." + allowed) for allowed in RENDER_ASSET_ALLOWED_HOSTS)
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(timeout=RENDER_ASSET_FETCH_TIMEOUT, follow_redirects=True)
+        return _http_client
+
+
+def fetch_into_cache(cache, url, headers=None):
+    """回源抓取一个资源并写入缓存，返回 (状态码, 响应头, 响应体)；只缓存 200 响应"""
+    response = _get_http_client().get(url, headers=headers)
+    result = (response.status_code, dict(response.headers), response.content)
+    if response.status_code == 200:
+        cache.put(url, *result)
+        cache.count("fetched")
+    return result
+
+
+class RequestInterceptor:
+    """
+    通过独立的 DevTools WebSocket 连接拦截单个标签页的网络请求。
+
+    参数:
+        debugger_address: Chrome 的 host:port（chromedriver 返回的 debuggerAddress）
+        target_id: 标签页的 target id（即 selenium 的 window handle）
+        cache: AssetCache
+        mode: "cache" 或 "offline"
+    """
+
+    def __init__(self, debugger_address, target_id, cache, mode=RENDER_ASSET_MODE):
+        self.cache = cache
+        self.mode = mode
+        self._url = f"ws://{debugger_address}/devtools/page/{target_id}"
+        # 页面 target 的主框架 id 与 target id 相同
+        self._main_frame_id = target_id
+        self._ws = None
+        self._send_lock = threading.Lock()
+        self._next_id = 0
+        self._enable_id = 1  # Fetch.enable 总是第一条消息
+        self._enabled = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._fetchers = None
+
+    def start(self, timeout=5.0):
+        self._ws = websocket.create_connection(self._url, timeout=timeout, suppress_origin=True)
+        self._ws.settimeout(0.5)
+        self._fetchers = ThreadPoolExecutor(max_workers=RENDER_ASSET_FETCH_WORKERS, thread_name_prefix="asset-fetch")
+        self._thread = threading.Thread(target=self._loop, name="asset-interceptor", daemon=True)
+        self._thread.start()
+        self._send("Fetch.enable", {"patterns": [{"urlPattern": "*", "requestStage": "Request"}]})
+        if not self._enabled.wait(timeout):
+            self.stop()
+            raise TimeoutError("启用请求拦截超时")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._fetchers:
+            self._fetchers.shutdown(wait=False, cancel_futures=True)
+        if self._ws:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+    def _send(self, method, params):
+        with self._send_lock:
+            self._next_id += 1
+            message_id = self._next_id
+            try:
+                self._ws.send(json.dumps({"id": message_id, "method": method, "params": params}))
+            except Exception as e:
+                if not self._stopped.is_set():
+                    logger.warning(f"发送 {method} 失败: {e}")
+        return message_id
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                message = json.loads(self._ws.recv())
+            except websocket.WebSocketTimeoutException:
+                continue
+            except Exception:
+                break  # 标签页关闭或连接断开
+            if message.get("id") == self._enable_id:
+                self._enabled.set()
+            elif message.get("method") == "Fetch.requestPaused":
+                try:
+                    self._handle(message["params"])
+                except Exception as e:
+                    logger.warning(f"处理拦截请求失败: {e}")
+                    self._fail(message["params"]["requestId"])
+
+    def _handle(self, params):
+        request_id = params["requestId"]
+        url = params["request"]["url"]
+        scheme = urlsplit(url).scheme
+        is_main_document = params.get("resourceType") == "Document" and params.get("frameId") == self._main_frame_id
+        if scheme in _PASS_THROUGH_SCHEMES or is_main_document:
+            self._send("Fetch.continueRequest", {"requestId": request_id})
+            return
+        cached = self.cache.get(url)
+        if cached:
+            self._fulfill(request_id, *cached)
+        elif self.mode == "cache" and is_allowed_host(url):
+            # 回源抓取放到线程池里，不阻塞其他请求的处理
+            self._fetchers.submit(self._fetch, request_id, url, params["request"].get("headers") or {})
+        else:
+            self.cache.count("blocked")
+            logger.info(f"拦截未缓存的资源请求: {url}")
+            self._fail(request_id)
+
+    def _fetch(self, request_id, url, headers):
+        try:
+            self._fulfill(request_id, *fetch_into_cache(self.cache, url, headers))
+        except Exception as e:
+            logger.warning(f"资源回源失败 {url}: {e}")
+            self._fail(request_id)
+
+    def _fulfill(self, request_id, status, headers, body):
+        response_headers = [{"name": k, "value": v} for k, v in headers.items() if k.lower() in _KEPT_HEADERS]
+        response_headers.append({"name": "Access-Control-Allow-Origin", "value": "*"})
+        self._send("Fetch.fulfillRequest", {
+            "requestId": request_id,
+            "responseCode": status,
+            "responseHeaders": response_headers,
+            "body": base64.b64encode(body).decode("ascii"),
+        })
+
+    def _fail(self, request_id):
+        self._send("Fetch.failRequest", {"requestId": request_id, "errorReason": "BlockedByClient"})
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_asset_cache():
+    """获取进程内共享的默认资源缓存（懒加载）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AssetCache()
+        return _default_cache
+
+
+def prefetch(urls, cache=None, user_agent=None):
+    """预先抓取资源写入缓存；CSS 中引用的字体等资源会一并抓取"""
+    cache = cache or get_asset_cache()
+    headers = {"User-Agent": user_agent} if user_agent else None
+    pending = list(urls)
+    seen = set()
+    while pending:
+        url = pending.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        try:
+            status, response_headers, body = fetch_into_cache(cache, url, headers)
+        except Exception as e:
+            print(f"抓取失败 {url}: {e}")
+            continue
+        print(f"{status} {url} ({len(body)} 字节)")
+        content_type = {k.lower(): v for k, v in response_headers.items()}.get("content-type", "")
+        if status == 200 and "text/css" in content_type:
+            for ref in _CSS_URL_RE.findall(body.decode("utf-8", "replace")):
+                if not ref.startswith("data:"):
+                    pending.append(urljoin(url, ref))
+
+
+def main():
+    from .browser_pool import MOBILE_USER_AGENT
+
+    parser = argparse.ArgumentParser(description="预先填充渲染资源缓存")
+    parser.add_argument("urls", nargs="*", help="要缓存的资源 URL")
+    parser.add_argument("--file", help="每行一个 URL 的文件")
+    args = parser.parse_args()
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            urls.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    # 与渲染时相同的 UA，Google Fonts 等会按 UA 返回不同的 CSS
+    prefetch(urls, user_agent=MOBILE_USER_AGENT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+离线批量卡片流水线。
+
+逐行读取 JSONL 任务文件，按 LLM → HTML 提取 → 渲染 → 卡片提取 四个阶段流水处理，
+每个阶段有独立的 worker 数量和有界队列。完成（或失败）的任务写入检查点文件，
+中断后重新运行同一命令即可从断点继续。
+
+任务行格式（每行一个 JSON 对象）:
+    {"id": "card-1", "mode": "prompt", "prompt": "...", "model": "...", "temperature": 0.7}
+    {"id": "card-2", "mode": "paste", "html_input": "<!DOCTYPE html>..."}
+id 缺省时使用 request_id，再缺省时使用行号；mode 缺省为 prompt。
+无法解析的行记为失败并跳过，不影响其余任务。
+
+用法（仓库根目录）:
+    python -m tools.batch_pipeline jobs.jsonl --output-dir output/batch --llm-workers 16 --render-workers 2
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import argparse
+
+from .llm_caller import generate_content_with_llm
+from .llm_prompt import extract_html_from_response
+from .prompt_config import SYSTEM_PROMPT_WEB_DESIGNER, USER_PROMPT_WEB_DESIGNER
+from .selenium2img import RENDER_DOM_CLIP, render_png
+from .card_extractor import extract_card_async
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """流水线中的一个阶段：有界队列 + 固定数量的 worker"""
+
+    def __init__(self, name, workers, handler, maxsize):
+        self.name = name
+        self.workers = max(1, workers)
+        self.handler = handler
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.tasks = []
+
+    def report(self, elapsed):
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        busy = self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0
+        return f"{self.name}: {self.processed} ok / {self.failed} failed, {rate:.2f}/s, 利用率 {busy:.0%}"
+
+
+class CardPipeline:
+    """
+    参数:
+        output_dir: 输出目录，生成 {id}.html 和 {id}.png
+        checkpoint_path: 检查点文件路径（JSONL）
+        llm_workers / render_workers / card_workers: 各阶段 worker 数
+        retry_failed: 重新运行时是否重试检查点中失败的任务
+    """
+
+    def __init__(self, output_dir, checkpoint_path, llm_workers=8, render_workers=2, card_workers=2,
+                 queue_size=64, retry_failed=False, keep_screenshots=False):
+        self.output_dir = output_dir
+        self.checkpoint_path = checkpoint_path
+        self.retry_failed = retry_failed
+        self.keep_screenshots = keep_screenshots
+        self.stages = [
+            Stage("llm", llm_workers, self._llm, queue_size),
+            Stage("extract_html", 1, self._extract_html, queue_size),
+            Stage("render", render_workers, self._render, queue_size),
+            Stage("card", card_workers, self._card, queue_size),
+        ]
+        self.skipped = 0
+        self.invalid = 0
+        self._checkpoint = None
+
+    # --- 各阶段处理函数 ---
+
+    async def _llm(self, job):
+        mode = job.get("mode") or "prompt"
+        if mode == "paste":
+            if not job.get("html_input"):
+                raise ValueError("paste模式需要提供html_input")
+            job["raw"] = job["html_input"]
+            return
+        if mode != "prompt":
+            raise ValueError(f"无效的生成模式: {mode}")
+        if not job.get("prompt"):
+            raise ValueError("prompt模式需要提供prompt")
+        # 与在线生成共用 provider 路由（并发上限、限流、429 重试与故障转移）
+        job["raw"] = await generate_content_with_llm(
+            prompt=USER_PROMPT_WEB_DESIGNER + job["prompt"],
+            model=job.get("model"),
+            temperature=0.7 if job.get("temperature") is None else job["temperature"],
+            sys_prompt=SYSTEM_PROMPT_WEB_DESIGNER,
+        )
+
+    async def _extract_html(self, job):
+        html = extract_html_from_response(job.pop("raw"))
+        job["html_path"] = os.path.join(self.output_dir, f"{job['name']}.html")
+        with open(job["html_path"], "w", encoding="utf-8") as f:
+            f.write(html)
+
+    async def _render(self, job):
+        job["screenshot"], job["clipped"] = await asyncio.to_thread(render_png, job["html_path"], clip_card=RENDER_DOM_CLIP)
+        if job["screenshot"] is None:
+            raise RuntimeError("渲染失败")
+        if self.keep_screenshots:
+            with open(os.path.join(self.output_dir, f"{job['name']}_screenshot.png"), "wb") as f:
+                f.write(job["screenshot"])
+
+    async def _card(self, job):
+        # 截图只在内存中传递；已按 DOM 裁剪的直接使用，否则在进程池中用 OpenCV 提取
+        screenshot = job.pop("screenshot")
+        card = screenshot if job["clipped"] else (await extract_card_async(screenshot))[0]
+        if card is None:
+            raise RuntimeError("卡片提取失败")
+        job["image_path"] = os.path.join(self.output_dir, f"{job['name']}.png")
+        with open(job["image_path"], "wb") as f:
+            f.write(card)
+
+    # --- 检查点 ---
+
+    def _load_checkpoint(self):
+        finished = set()
+        if not os.path.exists(self.checkpoint_path):
+            return finished
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时可能留下半行
+                if record["status"] == "done" or not self.retry_failed:
+                    finished.add(record["id"])
+        return finished
+
+    def _record(self, job, status, error=None):
+        record = {"id": job["id"], "status": status}
+        if status == "done":
+            record["html_path"] = job["html_path"]
+            record["image_path"] = job["image_path"]
+        if error:
+            record["error"] = error
+        self._checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._checkpoint.flush()
+
+    # --- 调度 ---
+
+    async def _worker(self, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            job = await stage.queue.get()
+            try:
+                start = time.monotonic()
+                try:
+                    await stage.handler(job)
+                except Exception as e:
+                    stage.failed += 1
+                    logger.error(f"[{stage.name}] 任务 {job['id']} 失败: {e}")
+                    self._record(job, "failed", f"{stage.name}: {e}")
+                    continue
+                finally:
+                    stage.busy_seconds += time.monotonic() - start
+                stage.processed += 1
+                if next_stage:
+                    await next_stage.queue.put(job)
+                else:
+                    self._record(job, "done")
+            finally:
+                # 转交下游之后才标记完成，保证逐级排空时不丢任务
+                stage.queue.task_done()
+
+    def _read_jobs(self, input_path, finished):
+        with open(input_path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise ValueError(f"应为 JSON 对象，实际为 {type(job).__name__}")
+                except ValueError as e:
+                    # 单行损坏只记为失败，不中断整批任务
+                    job_id = str(lineno)
+                    if job_id in finished:
+                        self.skipped += 1
+                        continue
+                    self.invalid += 1
+                    logger.error(f"第 {lineno} 行无法解析: {e}")
+                    self._record({"id": job_id}, "failed", f"第 {lineno} 行无法解析: {e}")
+                    continue
+                job["id"] = str(job.get("id") or job.get("request_id") or lineno)
+                if job["id"] in finished:
+                    self.skipped += 1
+                    continue
+                # 清洗后的 id 可能重名（a/b 与 a_b），加上 id 的短哈希避免互相覆盖
+                digest = hashlib.sha1(job["id"].encode("utf-8")).hexdigest()[:8]
+                job["name"] = re.sub(r"[^\w.-]", "_", job["id"]) + f"-{digest}"
+                yield job
+
+    async def _report_loop(self, started, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self._print_report(started)
+
+    def _print_report(self, started):
+        elapsed = time.monotonic() - started
+        print(f"[{elapsed:.0f}s] " + " | ".join(stage.report(elapsed) for stage in self.stages))
+
+    async def run(self, input_path, report_interval=10.0):
+        os.makedirs(self.output_dir, exist_ok=True)
+        finished = self._load_checkpoint()
+        started = time.monotonic()
+        self._checkpoint = open(self.checkpoint_path, "a", encoding="utf-8")
+        for index, stage in enumerate(self.stages):
+            stage.tasks = [asyncio.create_task(self._worker(index)) for _ in range(stage.workers)]
+        reporter = asyncio.create_task(self._report_loop(started, report_interval))
+        try:
+            for job in self._read_jobs(input_path, finished):
+                await self.stages[0].queue.put(job)
+            # 逐级排空：上游阶段全部完成后，下游队列不会再有新任务
+            for stage in self.stages:
+                await stage.queue.join()
+                for task in stage.tasks:
+                    task.cancel()
+        finally:
+            reporter.cancel()
+            for stage in self.stages:
+                for task in stage.tasks:
+                    task.cancel()
+            self._checkpoint.close()
+        print(f"完成，跳过检查点中已有的 {self.skipped} 个任务，{self.invalid} 行无法解析")
+        self._print_report(started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量卡片流水线")
+    parser.add_argument("input", help="JSONL 任务文件")
+    parser.add_argument("--output-dir", default=os.path.join("output", "batch"))
+    parser.add_argument("--checkpoint", default=None, help="检查点文件，默认 <output-dir>/checkpoint.jsonl")
+    parser.add_argument("--llm-workers", type=int, default=8)
+    parser.add_argument("--render-workers", type=int, default=2)
+    parser.add_argument("--card-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    parser.add_argument("--retry-failed", action="store_true", help="重试检查点中失败的任务")
+    parser.add_argument("--keep-screenshots", action="store_true")
+    args = parser.parse_args()
+
+    pipeline = CardPipeline(
+        output_dir=args.output_dir,
+        checkpoint_path=args.checkpoint or os.path.join(args.output_dir, "checkpoint.jsonl"),
+        llm_workers=args.llm_workers,
+        render_workers=args.render_workers,
+        card_workers=args.card_workers,
+        queue_size=args.queue_size,
+        retry_failed=args.retry_failed,
+        keep_screenshots=args.keep_screenshots,
+    )
+    asyncio.run(pipeline.run(args.input, report_interval=args.report_interval))
+
+
+if __name__ == "__main__":
+    main()
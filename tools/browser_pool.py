@@ -0,0 +1,357 @@
+"""
+常驻的无头 Chrome 浏览器池。
+
+每次渲染只需在一个已预热的浏览器里开一个新标签页，视口尺寸通过 CDP
+在运行时设置，不再为调整高度重新启动 Chrome。
+"""
+import os
+import base64
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from .asset_cache import RENDER_ASSET_MODE, RequestInterceptor, get_asset_cache
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# 池大小与回收阈值，可通过环境变量调整
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+RENDER_MAX_RENDERS = int(os.getenv("RENDER_MAX_RENDERS", "50"))
+RENDER_ACQUIRE_TIMEOUT = float(os.getenv("RENDER_ACQUIRE_TIMEOUT", "60"))
+RENDER_READY_TIMEOUT = float(os.getenv("RENDER_READY_TIMEOUT", "10"))
+
+# iPhone 15 的默认视口参数
+DEFAULT_WIDTH = 393
+DEFAULT_HEIGHT = 852
+DEFAULT_PIXEL_RATIO = 3.0
+# 卡片元素的候选选择器（按优先级，逗号分隔），以及裁剪时在元素四周保留的边距（CSS 像素）
+CARD_SELECTORS = [s.strip() for s in os.getenv(
+    "CARD_SELECTORS", ".card, [data-card], [class*='card'], body > :only-child"
+).split(",") if s.strip()]
+CARD_CLIP_MARGIN = int(os.getenv("CARD_CLIP_MARGIN", "8"))
+CARD_MIN_SIZE = 50
+MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+
+# 等待 DOM 就绪并且所有字体加载完成，再等一帧让布局稳定
+_WAIT_READY_SCRIPT = """
+const done = arguments[arguments.length - 1];
+const fontsReady = () => (document.fonts ? document.fonts.ready : Promise.resolve());
+const finish = () => fontsReady().then(() => requestAnimationFrame(() => done(true)));
+if (document.readyState === 'complete') {
+    finish();
+} else {
+    window.addEventListener('load', finish, { once: true });
+}
+"""
+
+_PAGE_HEIGHT_SCRIPT = """
+return Math.max(
+    document.body.scrollHeight,
+    document.documentElement.scrollHeight,
+    document.body.offsetHeight,
+    document.documentElement.offsetHeight,
+    document.body.clientHeight,
+    document.documentElement.clientHeight
+);
+"""
+
+# 依次尝试各个选择器，取面积最大的匹配元素，返回加上边距并限制在文档范围内的裁剪区域
+_CARD_RECT_SCRIPT = """
+const [selectors, margin, minSize] = arguments;
+const doc = document.documentElement;
+const docWidth = Math.max(doc.scrollWidth, document.body.scrollWidth);
+const docHeight = Math.max(doc.scrollHeight, document.body.scrollHeight);
+for (const selector of selectors) {
+    let best = null;
+    let elements;
+    try {
+        elements = document.querySelectorAll(selector);
+    } catch (e) {
+        continue;
+    }
+    for (const el of elements) {
+        const r = el.getBoundingClientRect();
+        if (r.width >= minSize && r.height >= minSize && (!best || r.width * r.height > best.width * best.height)) {
+            best = r;
+        }
+    }
+    if (best) {
+        const x = Math.max(0, best.left + window.scrollX - margin);
+        const y = Math.max(0, best.top + window.scrollY - margin);
+        return {
+            selector: selector,
+            x: x,
+            y: y,
+            width: Math.min(docWidth, best.right + window.scrollX + margin) - x,
+            height: Math.min(docHeight, best.bottom + window.scrollY + margin) - y,
+        };
+    }
+}
+return null;
+"""
+
+
+def build_chrome_options():
+    """构造渲染用的 Chrome 启动参数"""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--hide-scrollbars")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    return chrome_options
+
+
+class _PooledBrowser:
+    """池中的单个浏览器实例及其使用计数"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.base_handle = driver.current_window_handle
+        self.renders = 0
+
+    def is_healthy(self):
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"关闭浏览器失败: {e}")
+
+
+class BrowserPool:
+    """
+    线程安全的常驻浏览器池。
+
+    参数:
+        size: 同时存活的浏览器数量上限
+        max_renders: 单个浏览器渲染多少次后回收重启，防止内存泄漏累积
+        options_factory: 返回 Chrome Options 的函数
+    """
+
+    def __init__(self, size=RENDER_POOL_SIZE, max_renders=RENDER_MAX_RENDERS, options_factory=build_chrome_options):
+        self.size = max(1, size)
+        self.max_renders = max(1, max_renders)
+        self.options_factory = options_factory
+        self._idle = []  # 空闲浏览器栈，后进先出
+        self._lock = threading.Lock()
+        # 归还浏览器或释放名额（回收/损坏）时通知等待者，二者都可能让等待者继续
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._closed = False
+        self.stats = {"launched": 0, "recycled": 0, "unhealthy": 0, "renders": 0}
+
+    def _launch(self):
+        driver = webdriver.Chrome(options=self.options_factory())
+        driver.set_script_timeout(RENDER_READY_TIMEOUT)
+        with self._lock:
+            self.stats["launched"] += 1
+        logger.info(f"浏览器池启动新浏览器 ({self._created}/{self.size})")
+        return _PooledBrowser(driver)
+
+    def _checkout(self, timeout):
+        """取出一个空闲浏览器；池未满时按需启动新实例，否则等待归还或空出名额"""
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("浏览器池已关闭")
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    raise TimeoutError(f"等待空闲浏览器超时 ({timeout}s)")
+        try:
+            return self._launch()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, browser):
+        browser.quit()
+        self._release_slot()
+
+    def _checkin(self, browser, broken=False):
+        browser.renders += 1
+        with self._lock:
+            self.stats["renders"] += 1
+            recycle = not broken and not self._closed and browser.renders >= self.max_renders
+            if recycle:
+                self.stats["recycled"] += 1
+        if broken or self._closed:
+            self._discard(browser)
+        elif recycle:
+            logger.info(f"浏览器已渲染 {browser.renders} 次，回收重启")
+            self._discard(browser)
+        else:
+            with self._available:
+                self._idle.append(browser)
+                self._available.notify()
+
+    @contextmanager
+    def acquire(self, timeout=RENDER_ACQUIRE_TIMEOUT):
+        """借出一个健康的浏览器，用完自动归还"""
+        with timed("browser_acquire"):
+            browser = self._checkout(timeout)
+            while not browser.is_healthy():
+                with self._lock:
+                    self.stats["unhealthy"] += 1
+                logger.warning("检测到浏览器不可用，重新启动")
+                self._discard(browser)
+                browser = self._checkout(timeout)
+        broken = False
+        try:
+            yield browser
+        except Exception:
+            broken = not browser.is_healthy()
+            raise
+        finally:
+            self._checkin(browser, broken=broken)
+
+    @contextmanager
+    def tab(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, pixel_ratio=DEFAULT_PIXEL_RATIO, timeout=RENDER_ACQUIRE_TIMEOUT):
+        """
+        在池中浏览器里打开一个带移动端仿真的新标签页，退出时关闭该标签页。
+
+        产出 selenium driver，当前窗口已切换到新标签页。
+        """
+        with self.acquire(timeout=timeout) as browser:
+            driver = browser.driver
+            driver.switch_to.new_window("tab")
+            interceptor = None
+            try:
+                driver.execute_cdp_cmd("Emulation.setUserAgentOverride", {"userAgent": MOBILE_USER_AGENT})
+                set_viewport(driver, width, height, pixel_ratio)
+                interceptor = _start_interceptor(driver)
+                yield driver
+            finally:
+                try:
+                    if interceptor:
+                        interceptor.stop()
+                    driver.close()
+                finally:
+                    driver.switch_to.window(browser.base_handle)
+
+    def close(self):
+        """关闭池中所有空闲浏览器；借出中的浏览器归还时关闭"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for browser in idle:
+            self._discard(browser)
+
+    def snapshot(self):
+        """返回池的当前状态，便于监控"""
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": len(self._idle),
+            **self.stats,
+        }
+
+
+def _start_interceptor(driver):
+    """按 RENDER_ASSET_MODE 为当前标签页启用子资源拦截（资源缓存 + 未知主机快速失败）"""
+    if RENDER_ASSET_MODE not in ("cache", "offline"):
+        return None
+    debugger_address = driver.capabilities.get("goog:chromeOptions", {}).get("debuggerAddress")
+    if not debugger_address:
+        logger.warning("无法获取 debuggerAddress，跳过资源拦截")
+        return None
+    interceptor = RequestInterceptor(debugger_address, driver.current_window_handle, get_asset_cache())
+    try:
+        interceptor.start()
+    except Exception as e:
+        logger.warning(f"启用资源拦截失败，本次渲染直接访问网络: {e}")
+        return None
+    return interceptor
+
+
+def set_viewport(driver, width, height, pixel_ratio=DEFAULT_PIXEL_RATIO):
+    """运行时修改当前标签页的视口尺寸（移动端仿真）"""
+    driver.execute_cdp_cmd("Emulation.setDeviceMetricsOverride", {
+        "width": int(width),
+        "height": int(height),
+        "deviceScaleFactor": pixel_ratio,
+        "mobile": True,
+    })
+
+
+def wait_until_ready(driver):
+    """等待 document 加载完成且字体就绪，替代固定 sleep"""
+    try:
+        driver.execute_async_script(_WAIT_READY_SCRIPT)
+    except Exception as e:
+        logger.warning(f"等待页面就绪超时，继续截图: {e}")
+
+
+def measure_page_height(driver):
+    """计算页面完整内容高度"""
+    return driver.execute_script(_PAGE_HEIGHT_SCRIPT)
+
+
+def find_card_rect(driver, selectors=None, margin=CARD_CLIP_MARGIN):
+    """
+    通过 DOM 查询卡片元素的位置（getBoundingClientRect），返回文档坐标下的
+    {selector, x, y, width, height}（CSS 像素），找不到时返回 None。
+    """
+    try:
+        return driver.execute_script(_CARD_RECT_SCRIPT, selectors or CARD_SELECTORS, margin, CARD_MIN_SIZE)
+    except Exception as e:
+        logger.warning(f"查询卡片元素位置失败: {e}")
+        return None
+
+
+def capture_clip(driver, rect):
+    """只截取文档中的指定区域，返回 PNG 字节（分辨率按当前 deviceScaleFactor）"""
+    result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+        "format": "png",
+        "clip": {"x": rect["x"], "y": rect["y"], "width": rect["width"], "height": rect["height"], "scale": 1},
+        "captureBeyondViewport": True,
+    })
+    return base64.b64decode(result["data"])
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """获取进程内共享的默认浏览器池（懒加载）"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = BrowserPool()
+        return _default_pool
+
+
+def shutdown_browser_pool():
+    """关闭默认浏览器池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+            _default_pool = None
+
+
+atexit.register(shutdown_browser_pool)
@@ -1,8 +1,37 @@
 import cv2
 import numpy as np
 import os
+import math
+import time
+import threading
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_card_from_image(image_path, output_path, min_area=500, debug=False):
+from .metrics import observe_stage
+
+# OpenCV 处理是 CPU 密集型的，放到进程池里执行，不阻塞事件循环并能用满多核
+CARD_EXTRACT_WORKERS = int(os.getenv("CARD_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+# 边界框检测在不超过该宽度的缩小副本上进行（0 表示在原图上检测）
+CARD_DETECT_WIDTH = int(os.getenv("CARD_DETECT_WIDTH", "600"))
+# 原图（3x DPR 截图）上检测时使用的缩放因子
+FULL_RES_SCALE_FACTOR = 2
+# 按顺序尝试的检测策略（逗号分隔），第一个成功的即返回
+CARD_STRATEGIES = [s.strip() for s in os.getenv("CARD_STRATEGIES", "contours,mser,otsu").split(",") if s.strip()]
+# 输出图像像素上限，超过时等比缩小，避免异常的超长截图撑爆 worker 内存
+CARD_MAX_OUTPUT_PIXELS = int(os.getenv("CARD_MAX_OUTPUT_PIXELS", str(20_000_000)))
+# MSER 输入的像素上限，以及认为找到内容所需的最少区域数
+CARD_MSER_MAX_PIXELS = int(os.getenv("CARD_MSER_MAX_PIXELS", str(2_000_000)))
+CARD_MSER_MIN_REGIONS = 5
+# 灰度标准差低于此值视为纯色图像，直接跳过检测
+CARD_BLANK_STDDEV = 2.0
+
+def _odd(size):
+    """核尺寸取整为不小于 3 的奇数"""
+    size = max(3, int(size))
+    return size if size % 2 else size + 1
+
+def extract_card_from_image(image_path, output_path, min_area=500, debug=False, detect_width=None):
     """
     从图片中提取包含所有文字/内容块的完整卡片区域，优先识别最大内容块。
     
@@ -11,146 +40,300 @@ def extract_card_from_image(image_path, output_path, min_area=500, debug=False):
         output_path: 输出卡片图片路径
         min_area: 最小文字块面积(像素)
         debug: 是否保存调试图片
+        detect_width: 检测用图像的最大宽度（见 extract_card_from_array）
     """
     # 读取图片
     img = cv2.imread(image_path)
     if img is None:
         print(f"无法读取图片: {image_path}")
         return False
-    
-    original = img.copy()
+
+    card, found = extract_card_from_array(img, min_area=min_area, debug_path=output_path if debug else None,
+                                          detect_width=detect_width)
+    cv2.imwrite(output_path, card)
+    if found:
+        print(f"卡片已提取保存到 {output_path} (基于最大内容块)")
+    return found
+
+def extract_card_from_bytes(image_bytes, min_area=500, detect_width=None):
+    """
+    内存版本：输入截图的 PNG 字节，返回 (裁剪后卡片的 PNG 字节, 是否成功定位卡片)。
+    无法解码时返回 (None, False)。全程不落盘。
+    """
+    png, found, trace = _extract_bytes(image_bytes, min_area, detect_width)
+    if trace:
+        _record(trace)
+    return png, found
+
+def _extract_bytes(image_bytes, min_area=500, detect_width=None):
+    """extract_card_from_bytes 的实现，额外返回 trace（进程池 worker 执行的就是这个函数）"""
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        print("无法解码图片数据")
+        return None, False, None
+    card, found, trace = _extract(img, min_area, None, detect_width)
+    ok, encoded = cv2.imencode(".png", card)
+    if not ok:
+        return None, False, trace
+    return encoded.tobytes(), found, trace
+
+def extract_card_from_array(img, min_area=500, debug_path=None, detect_width=None):
+    """
+    从 BGR 图像数组中提取卡片区域，返回 (卡片图像数组, 是否成功定位卡片)。
+
+    依次尝试 CARD_STRATEGIES 中的检测策略，第一个成功的即返回；全部失败时返回原图。
+    输出像素数不超过 CARD_MAX_OUTPUT_PIXELS。
+
+    参数：
+        img: cv2 读取的 BGR 图像
+        min_area: 最小文字块面积(像素)
+        debug_path: 设置时以此路径为前缀保存调试图片
+        detect_width: 检测用图像的最大宽度，超过时按整数倍缩小后再检测，边界框映射回原图裁剪；
+                      None 使用 CARD_DETECT_WIDTH，0 表示在原图上检测
+    """
+    card, found, trace = _extract(img, min_area, debug_path, detect_width)
+    _record(trace)
+    return card, found
+
+def _extract(img, min_area, debug_path, detect_width):
+    """extract_card_from_array 的实现，额外返回本次各策略的耗时与结果（trace）"""
+    trace = {"strategies": [], "blank": False, "capped": False, "seconds": 0.0}
+    started = time.perf_counter()
     height, width = img.shape[:2]
+
+    # 转换为灰度图
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    # 在缩小的灰度副本上检测边界框，模糊/阈值/形态学的开销随像素数下降。
+    # 使用整数缩小倍数：INTER_AREA 在整数倍时走快速路径
+    if detect_width is None:
+        detect_width = CARD_DETECT_WIDTH
+    factor = math.ceil(width / detect_width) if 0 < detect_width < width else 1
+    if factor > 1:
+        gray = cv2.resize(gray, None, fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
     
-    # 假设输入图像来自更高分辨率的源，设置缩放因子
-    # 如果图像本身就是原始分辨率，可以设为1
-    scale_factor = 2  # 根据实际情况调整
+    # 全分辨率截图（3x DPR）对应缩放因子 2，检测图缩小时按比例缩小，核尺寸随之变化
+    scale_factor = FULL_RES_SCALE_FACTOR / factor
+
+    # 提前退出：几乎纯色的图像上任何策略都找不到内容
+    _, stddev = cv2.meanStdDev(gray)
+    if stddev[0][0] < CARD_BLANK_STDDEV:
+        print("图像几乎为纯色，跳过卡片检测")
+        trace["blank"] = True
+        box = None
+    else:
+        box = None
+        for name in CARD_STRATEGIES:
+            if name not in _STRATEGIES:
+                continue
+            start = time.perf_counter()
+            box = _STRATEGIES[name](gray, scale_factor, min_area * (scale_factor ** 2), debug_path)
+            trace["strategies"].append((name, time.perf_counter() - start, box is not None))
+            if box is not None:
+                break
+            print(f"卡片检测策略 {name} 未找到内容区域")
+
+    if box is None:
+        # 所有方法失败：原样返回原图（不再放大），由上限保护内存
+        print("所有方法均无法提取卡片内容区域，返回原始图像")
+        card, trace["capped"] = _cap_pixels(img)
+        trace["seconds"] = time.perf_counter() - started
+        return card, False, trace
+
+    card_x, card_y, card_w, card_h = box
+
+    # 检测图上的边界框映射回原图，向外取整
+    if factor > 1:
+        x_end_full = min(width, (card_x + card_w) * factor)
+        y_end_full = min(height, (card_y + card_h) * factor)
+        card_x, card_y = card_x * factor, card_y * factor
+        card_w, card_h = x_end_full - card_x, y_end_full - card_y
     
-    # 根据缩放因子调整参数
-    scaled_min_area = min_area * (scale_factor ** 2)
+    # --- 添加边距 --- 
+    # 根据卡片尺寸动态添加边距
+    padding_h = int(width * 0.015) # 水平边距 1.5%
+    padding_v = int(height * 0.015) # 垂直边距 1.5%
     
-    # 转换为灰度图
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    x_start = max(0, card_x - padding_h)
+    y_start = max(0, card_y - padding_v)
+    x_end = min(width, card_x + card_w + padding_h)
+    y_end = min(height, card_y + card_h + padding_v)
     
+    # 提取卡片区域
+    card, trace["capped"] = _cap_pixels(img[y_start:y_end, x_start:x_end])
+    trace["seconds"] = time.perf_counter() - started
+    return card, True, trace
+
+def _union_box(boxes):
+    """多个 (x, y, w, h) 边界框的外接框"""
+    min_x = min(x for x, _, _, _ in boxes)
+    min_y = min(y for _, y, _, _ in boxes)
+    max_x = max(x + w for x, _, w, _ in boxes)
+    max_y = max(y + h for _, y, _, h in boxes)
+    return min_x, min_y, max_x - min_x, max_y - min_y
+
+def _covers_image(box, shape):
+    """边界框是否几乎覆盖整幅图（备用策略把整页背景当成内容时会出现）"""
+    return box[2] * box[3] >= 0.98 * shape[0] * shape[1]
+
+def _contours_strategy(gray, scale_factor, scaled_min_area, debug_path):
+    """自适应阈值 + 形态学闭运算连接文字区域，以最大轮廓为主，外扩到所有足够大的轮廓"""
+    debug = debug_path is not None
+
     # 预处理：高斯模糊 + 自适应阈值
-    blur_kernel_size = max(3, int(3 * scale_factor))
-    if blur_kernel_size % 2 == 0: blur_kernel_size += 1
+    blur_kernel_size = _odd(3 * scale_factor)
     blurred = cv2.GaussianBlur(gray, (blur_kernel_size, blur_kernel_size), 0)
     
-    block_size = max(11, int(11 * scale_factor))
-    if block_size % 2 == 0: block_size += 1
+    block_size = _odd(11 * scale_factor)
     thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
                                    cv2.THRESH_BINARY_INV, block_size, 2)
     
     if debug:
-        cv2.imwrite(output_path.replace('.png', '_thresh.png'), thresh)
+        cv2.imwrite(debug_path.replace('.png', '_thresh.png'), thresh)
         
     # 形态学操作连接文字区域
-    kernel_h_size = max(15, int(15 * scale_factor))
-    kernel_v_size = max(15, int(15 * scale_factor))
+    kernel_h_size = max(1, int(15 * scale_factor))
+    kernel_v_size = max(1, int(15 * scale_factor))
     kernel_h = np.ones((1, kernel_h_size), np.uint8)
     kernel_v = np.ones((kernel_v_size, 1), np.uint8)
     connected = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel_h)
     connected = cv2.morphologyEx(connected, cv2.MORPH_CLOSE, kernel_v)
     
     if debug:
-        cv2.imwrite(output_path.replace('.png', '_connected.png'), connected)
+        cv2.imwrite(debug_path.replace('.png', '_connected.png'), connected)
         
-    # 查找轮廓
+    # 查找轮廓，过滤掉面积过小的轮廓
     contours, _ = cv2.findContours(connected, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # --- 新思路：找到最大的轮廓作为主要卡片区域 --- 
-    largest_contour = None
-    max_area = 0
-    all_contours_bbox = [] # 存储所有有效轮廓的边界框
-    
-    if contours:
-        # 过滤掉面积过小的轮廓，并记录边界框
-        valid_contours = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area >= scaled_min_area:
-                valid_contours.append(contour)
-                all_contours_bbox.append(cv2.boundingRect(contour))
-                if area > max_area:
-                    max_area = area
-                    largest_contour = contour
-        
-        if largest_contour is not None:
-            # 获取最大轮廓的边界框
-            card_x, card_y, card_w, card_h = cv2.boundingRect(largest_contour)
-            
-            if debug:
-                debug_img = original.copy()
-                cv2.drawContours(debug_img, [largest_contour], -1, (0, 255, 0), 3)
-                cv2.rectangle(debug_img, (card_x, card_y), (card_x + card_w, card_y + card_h), (0, 0, 255), 2)
-                cv2.imwrite(output_path.replace('.png', '_largest_contour.png'), debug_img)
-            
-            # --- 微调边界以包含所有检测到的内容 --- 
-            if all_contours_bbox:
-                min_x, min_y = card_x, card_y
-                max_x, max_y = card_x + card_w, card_y + card_h
-                
-                for x_c, y_c, w_c, h_c in all_contours_bbox:
-                    min_x = min(min_x, x_c)
-                    min_y = min(min_y, y_c)
-                    max_x = max(max_x, x_c + w_c)
-                    max_y = max(max_y, y_c + h_c)
-                    
-                # 更新卡片边界以包含所有内容
-                card_x, card_y = min_x, min_y
-                card_w = max_x - min_x
-                card_h = max_y - min_y
-            
-            # --- 添加边距 --- 
-            # 根据卡片尺寸动态添加边距
-            padding_h = int(width * 0.015) # 水平边距 1.5%
-            padding_v = int(height * 0.015) # 垂直边距 1.5%
-            
-            x_start = max(0, card_x - padding_h)
-            y_start = max(0, card_y - padding_v)
-            x_end = min(width, card_x + card_w + padding_h)
-            y_end = min(height, card_y + card_h + padding_v)
-            
-            # 提取卡片区域
-            card = original[y_start:y_end, x_start:x_end]
-            
-            # 保存结果
-            cv2.imwrite(output_path, card)
-            print(f"卡片已提取保存到 {output_path} (基于最大内容块)")
-            return True
-        else:
-            print("未找到足够大的内容轮廓")
-    else:
-        print("未找到任何轮廓")
+    valid_contours = [c for c in contours if cv2.contourArea(c) >= scaled_min_area]
+    if not valid_contours:
+        return None
 
-    # 如果主要方法失败，尝试使用备用方法（如果需要，可以重新启用）
-    print("主要方法失败，尝试备用方法...")
+    # 最大轮廓作为主要卡片区域，再外扩以包含所有检测到的内容
+    largest_contour = max(valid_contours, key=cv2.contourArea)
+    box = _union_box([cv2.boundingRect(c) for c in valid_contours])
 
-    # --- MSER备用方法 --- 
-    mser = cv2.MSER_create()
-    regions, _ = mser.detectRegions(gray)
-    if regions:
-        # ... (此处省略MSER逻辑，与之前类似，如果需要可以恢复) ...
-        # 如果MSER成功，保存并返回True
-        pass 
+    if debug:
+        card_x, card_y, card_w, card_h = box
+        debug_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        cv2.drawContours(debug_img, [largest_contour], -1, (0, 255, 0), 3)
+        cv2.rectangle(debug_img, (card_x, card_y), (card_x + card_w, card_y + card_h), (0, 0, 255), 2)
+        cv2.imwrite(debug_path.replace('.png', '_largest_contour.png'), debug_img)
+    return box
+
+def _mser_strategy(gray, scale_factor, scaled_min_area, debug_path):
+    """MSER 检测文字类稳定区域，取其外接框；输入超过像素上限时先整数倍缩小"""
+    shape = gray.shape[:2]
+    factor = max(1, math.ceil(math.sqrt(gray.size / CARD_MSER_MAX_PIXELS)))
+    if factor > 1:
+        gray = cv2.resize(gray, None, fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
+    # 默认的最小区域面积 (60) 对缩小后的细字体偏大，随缩放因子调整
+    mser = cv2.MSER_create(min_area=max(10, int(15 * (scale_factor / factor) ** 2)))
+    _, bboxes = mser.detectRegions(gray)
+    if len(bboxes) < CARD_MSER_MIN_REGIONS:
+        return None
+    box = tuple(int(v) * factor for v in _union_box(bboxes.tolist()))
+    return None if _covers_image(box, shape) else box
 
-    # --- Otsu备用方法 --- 
+def _otsu_strategy(gray, scale_factor, scaled_min_area, debug_path):
+    """Otsu 全局阈值 + 闭运算，取所有足够大的轮廓的外接框"""
     _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    kernel = np.ones((5, 5), np.uint8)
-    morph = cv2.morphologyEx(otsu, cv2.MORPH_CLOSE, kernel)
-    otsu_contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if otsu_contours:
-        # ... (此处省略Otsu逻辑，与之前类似，如果需要可以恢复) ...
-        # 如果Otsu成功，保存并返回True
-        pass
-
-    # 所有方法失败
-    print("所有方法均无法提取卡片内容区域，返回原始图像并进行超分处理")
-    # 使用线性插值将原始图像放大3倍
-    h, w = original.shape[:2]
-    resized_original = cv2.resize(original, (w * 3, h * 3), interpolation=cv2.INTER_LINEAR)
-    cv2.imwrite(output_path, resized_original)
-    return False
+    kernel_size = max(1, int(2.5 * scale_factor))
+    morph = cv2.morphologyEx(otsu, cv2.MORPH_CLOSE, np.ones((kernel_size, kernel_size), np.uint8))
+    contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= scaled_min_area]
+    if not boxes:
+        return None
+    box = _union_box(boxes)
+    return None if _covers_image(box, gray.shape[:2]) else box
+
+_STRATEGIES = {
+    "contours": _contours_strategy,
+    "mser": _mser_strategy,
+    "otsu": _otsu_strategy,
+}
+
+def _cap_pixels(img):
+    """输出超过 CARD_MAX_OUTPUT_PIXELS 时等比缩小，返回 (图像, 是否被缩小)"""
+    h, w = img.shape[:2]
+    if h * w <= CARD_MAX_OUTPUT_PIXELS:
+        return img, False
+    ratio = math.sqrt(CARD_MAX_OUTPUT_PIXELS / (h * w))
+    size = (max(1, int(w * ratio)), max(1, int(h * ratio)))
+    print(f"输出图像 {w}x{h} 超过像素上限，缩小为 {size[0]}x{size[1]}")
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA), True
+
+_stats_lock = threading.Lock()
+_stats = {
+    "strategies": {name: {"attempts": 0, "successes": 0, "seconds": 0.0} for name in _STRATEGIES},
+    "extractions": 0,
+    "failed": 0,
+    "blank": 0,
+    "capped": 0,
+}
+
+def _record(trace):
+    """把一次提取的 trace 计入统计（进程池中的提取由父进程记录）"""
+    observe_stage("card_extract", trace["seconds"])
+    with _stats_lock:
+        _stats["extractions"] += 1
+        _stats["blank"] += trace["blank"]
+        _stats["capped"] += trace["capped"]
+        if not any(ok for _, _, ok in trace["strategies"]):
+            _stats["failed"] += 1
+        for name, seconds, ok in trace["strategies"]:
+            counters = _stats["strategies"][name]
+            counters["attempts"] += 1
+            counters["successes"] += ok
+            counters["seconds"] += seconds
+
+def extractor_stats():
+    """各检测策略的尝试次数、成功次数与平均耗时"""
+    with _stats_lock:
+        strategies = {
+            name: {
+                **counters,
+                "avg_ms": counters["seconds"] / counters["attempts"] * 1000 if counters["attempts"] else None,
+            }
+            for name, counters in _stats["strategies"].items()
+        }
+        return {**_stats, "strategies": strategies}
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def get_extract_pool():
+    """获取卡片提取进程池（懒加载，使用 spawn 避免 fork 带有线程的父进程）"""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=CARD_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _extract_pool
+
+def shutdown_extract_pool():
+    """关闭卡片提取进程池"""
+    global _extract_pool
+    with _extract_pool_lock:
+        pool, _extract_pool = _extract_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+def extract_card_in_pool(image_bytes, min_area=500):
+    """在进程池中执行 extract_card_from_bytes，阻塞等待结果（供线程中调用）"""
+    png, found, trace = get_extract_pool().submit(_extract_bytes, image_bytes, min_area).result()
+    if trace:
+        _record(trace)
+    return png, found
+
+async def extract_card_async(image_bytes, min_area=500):
+    """在进程池中执行 extract_card_from_bytes，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    png, found, trace = await loop.run_in_executor(get_extract_pool(), _extract_bytes, image_bytes, min_area)
+    if trace:
+        _record(trace)
+    return png, found
 
 # 示例用法
 if __name__ == "__main__":
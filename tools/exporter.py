@@ -0,0 +1,149 @@
+"""
+多格式导出：在浏览器池中只加载一次页面，从同一次渲染产出 PNG / WebP / AVIF / PDF。
+
+位图格式来自同一张截图（优先按 DOM 裁剪出卡片区域），各格式分别编码并可单独设置
+质量与最大宽度；PDF 通过 Chrome 的 Page.printToPDF 生成，页面尺寸与内容一致。
+
+取代 html2pic.py / html2pic2.py / html2pdf.py 这些各自启动渲染器的一次性脚本。
+"""
+import os
+import math
+import base64
+import logging
+
+import cv2
+import numpy as np
+
+from .metrics import timed
+from .card_extractor import _cap_pixels
+from .browser_pool import (
+    DEFAULT_HEIGHT,
+    DEFAULT_PIXEL_RATIO,
+    DEFAULT_WIDTH,
+    capture_clip,
+    find_card_rect,
+    get_browser_pool,
+    measure_page_height,
+    set_viewport,
+    wait_until_ready,
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("png", "webp", "avif", "pdf")
+MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+    "pdf": "application/pdf",
+}
+
+# 各格式的默认参数，max_width 为 0 表示保持截图原始宽度
+DEFAULT_EXPORT_OPTIONS = {
+    "png": {"compression": int(os.getenv("EXPORT_PNG_COMPRESSION", "6")), "max_width": 0},
+    "webp": {"quality": int(os.getenv("EXPORT_WEBP_QUALITY", "80")), "max_width": 0},
+    "avif": {"quality": int(os.getenv("EXPORT_AVIF_QUALITY", "60")), "max_width": 0},
+    "pdf": {"print_background": True},
+}
+
+_CSS_PX_PER_INCH = 96
+
+
+def parse_formats(value):
+    """解析逗号分隔的格式列表，去重并保持顺序；不支持的格式抛出 ValueError"""
+    formats = []
+    for fmt in (value or "").split(","):
+        fmt = fmt.strip().lower()
+        if not fmt or fmt in formats:
+            continue
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}（可选: {', '.join(EXPORT_FORMATS)}）")
+        if fmt == "avif" and not cv2.haveImageWriter("x.avif"):
+            raise ValueError("当前 OpenCV 构建不支持 AVIF 编码")
+        formats.append(fmt)
+    if not formats:
+        raise ValueError("至少需要一个导出格式")
+    return formats
+
+
+def _encode_raster(img, fmt, options):
+    max_width = options.get("max_width") or 0
+    if 0 < max_width < img.shape[1]:
+        ratio = max_width / img.shape[1]
+        img = cv2.resize(img, (max_width, max(1, math.ceil(img.shape[0] * ratio))), interpolation=cv2.INTER_AREA)
+    if fmt == "png":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, options["compression"]]
+    elif fmt == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, options["quality"]]
+    else:
+        params = [cv2.IMWRITE_AVIF_QUALITY, options["quality"]]
+    ok, encoded = cv2.imencode(f".{fmt}", img, params)
+    if not ok:
+        raise RuntimeError(f"{fmt} 编码失败")
+    return encoded.tobytes()
+
+
+def _print_pdf(driver, width, height, options):
+    """把整页打印为单页 PDF，纸张尺寸与页面内容尺寸一致"""
+    result = driver.execute_cdp_cmd("Page.printToPDF", {
+        "printBackground": options.get("print_background", True),
+        "paperWidth": width / _CSS_PX_PER_INCH,
+        "paperHeight": height / _CSS_PX_PER_INCH,
+        "marginTop": 0,
+        "marginBottom": 0,
+        "marginLeft": 0,
+        "marginRight": 0,
+        "pageRanges": "1",
+    })
+    return base64.b64decode(result["data"])
+
+
+def export_html(html_path, formats, options=None, width=DEFAULT_WIDTH, pixel_ratio=DEFAULT_PIXEL_RATIO,
+                clip_card=True, pool=None):
+    """
+    渲染一次 HTML，返回 {格式: 字节}。
+
+    参数:
+        html_path: 本地 HTML 文件路径或 URL
+        formats: 导出格式列表（EXPORT_FORMATS 的子集）
+        options: 按格式覆盖 DEFAULT_EXPORT_OPTIONS，如 {"webp": {"quality": 60}}
+        width / pixel_ratio: 视口宽度与设备像素比
+        clip_card: 位图格式只截取 DOM 中的卡片元素（找不到时截取整页）
+        pool: 使用的 BrowserPool（None 使用共享的默认池）
+    """
+    pool = pool or get_browser_pool()
+    merged = {fmt: {**DEFAULT_EXPORT_OPTIONS[fmt], **((options or {}).get(fmt) or {})} for fmt in formats}
+    if not html_path.startswith("http"):
+        html_path = "file://" + os.path.abspath(html_path)
+
+    results = {}
+    with pool.tab(width=width, height=DEFAULT_HEIGHT, pixel_ratio=pixel_ratio) as driver:
+        with timed("page_load"):
+            driver.get(html_path)
+            wait_until_ready(driver)
+            page_height = measure_page_height(driver)
+            set_viewport(driver, width, page_height, pixel_ratio)
+            wait_until_ready(driver)
+
+        raster_formats = [fmt for fmt in formats if fmt != "pdf"]
+        if raster_formats:
+            with timed("screenshot"):
+                rect = find_card_rect(driver) if clip_card else None
+                png = capture_clip(driver, rect) if rect else driver.get_screenshot_as_png()
+            # 只解码一次截图，各格式共用；与卡片提取相同，超过 CARD_MAX_OUTPUT_PIXELS 时先等比缩小再编码
+            img = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+            img, capped = _cap_pixels(img)
+            for fmt in raster_formats:
+                options_for_fmt = merged[fmt]
+                if (fmt == "png" and not capped and not options_for_fmt.get("max_width")
+                        and "compression" not in (options or {}).get("png", {})):
+                    results[fmt] = png  # 截图本身就是 PNG，未指定压缩级别与尺寸时无需重新编码
+                else:
+                    results[fmt] = _encode_raster(img, fmt, options_for_fmt)
+
+        if "pdf" in formats:
+            results["pdf"] = _print_pdf(driver, width, page_height, merged["pdf"])
+
+    for fmt, data in results.items():
+        logger.info(f"导出 {fmt}: {len(data)} 字节")
+    return results
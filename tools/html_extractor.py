@@ -0,0 +1,173 @@
+"""
+线性时间的 HTML 提取。
+
+extract_html 对完整文本做单遍扫描，结果与原先的正则级联一致，但不会在
+畸形的长输出上回溯。LLM 以流的形式返回内容时，逐块喂给 HtmlStreamExtractor，
+它会跨块边界找到 `<!DOCTYPE html>` / `<html>` 的起点和 `</html>` 的终点。
+"""
+
+import re
+
+_HTML_OPEN = "<html"
+_DOCTYPE = "<!doctype"
+_HTML_CLOSE = "</html>"
+
+# 以下模式都只含定长前缀或单个字符类，不会回溯，扫描是线性的
+_START_RE = re.compile(r"<(?:html|!doctype)", re.IGNORECASE)
+_DOCTYPE_TAIL_RE = re.compile(r"\s+html", re.IGNORECASE)
+_CLOSE_RE = re.compile(r"</html>", re.IGNORECASE)
+_OPEN_TAG_RE = re.compile(r"<[^>]")
+_CLOSE_TAG_RE = re.compile(r"</[^>]")
+
+
+def match_doctype(text, i):
+    """
+    判断 text[i:] 是否以 `<!DOCTYPE\\s+html` 开头。
+
+    返回 True / False；数据不足以判断时返回 None。
+    """
+    j = i + len(_DOCTYPE)
+    k = j
+    while k < len(text) and text[k].isspace():
+        k += 1
+    if k == j:
+        return None if k == len(text) else False
+    word = text[k:k + 4].lower()
+    if word == "html":
+        return True
+    if len(word) < 4 and "html".startswith(word):
+        return None
+    return False
+
+
+def _find_document(text):
+    r"""
+    查找第一个完整 HTML 文档，等价于
+    `(?:<!DOCTYPE\s+html[^>]*>|<html[^>]*>)[\s\S]*?</html>` (IGNORECASE)。
+    """
+    pos = 0
+    while True:
+        match = _START_RE.search(text, pos)
+        if match is None:
+            return None
+        i = match.start()
+        if match.group(0)[1] == "!" and not _DOCTYPE_TAIL_RE.match(text, match.end()):
+            pos = i + 1
+            continue
+        # 起始标签到第一个 '>' 结束；后面的候选只会更晚结束，找不到就整体失败
+        tag_end = text.find(">", match.end())
+        if tag_end < 0:
+            return None
+        close = _CLOSE_RE.search(text, tag_end + 1)
+        if close is None:
+            return None
+        return text[i:close.end()]
+
+
+def _find_fragment(text):
+    r"""
+    查找第一个 HTML 片段，等价于 `<[^>]+>[\s\S]*?</[^>]+>`。
+    """
+    # 开标签：'<' 后至少一个非 '>' 字符，到第一个 '>' 结束
+    opening = _OPEN_TAG_RE.search(text)
+    if opening is None:
+        return None
+    tag_end = text.find(">", opening.end())
+    if tag_end < 0:
+        return None
+    # 闭标签：'</' 后至少一个非 '>' 字符，到第一个 '>' 结束
+    closing = _CLOSE_TAG_RE.search(text, tag_end + 1)
+    if closing is None:
+        return None
+    close_end = text.find(">", closing.end())
+    if close_end < 0:
+        return None
+    return text[opening.start():close_end + 1]
+
+
+def extract_html(text):
+    """
+    从 LLM 响应中单遍提取 HTML：优先完整文档，其次任意 HTML 片段，
+    都没有时返回原始文本。
+
+    原实现中的 ```html 代码块匹配要求块内同样是完整文档，而这种情况已被
+    第一步覆盖，因此这里无需单独处理代码块。
+    """
+    document = _find_document(text)
+    if document is not None:
+        return document
+    fragment = _find_fragment(text)
+    if fragment is not None:
+        return fragment
+    return text
+
+
+class HtmlStreamExtractor:
+    """
+    流式 HTML 提取器。
+
+    用法:
+        extractor = HtmlStreamExtractor()
+        for chunk in stream:
+            html_piece = extractor.feed(chunk)
+    """
+
+    def __init__(self):
+        self._pending = ""      # 找到起点之前缓存的文本
+        self._tail = ""         # 文档末尾几个字符，用于跨块匹配 </html>
+        self._tag_closed = False  # 起始标签的 '>' 是否已出现，</html> 只在其后查找
+        self.started = False
+        self.finished = False
+
+    def feed(self, chunk):
+        """喂入一个文本块，返回本次新产生的 HTML 文本（可能为空字符串）"""
+        if self.finished or not chunk:
+            return ""
+        if not self.started:
+            self._pending += chunk
+            start = self._find_start()
+            if start is None:
+                return ""
+            self.started = True
+            chunk, self._pending = self._pending[start:], ""
+        return self._consume(chunk)
+
+    def _find_start(self):
+        text = self._pending
+        pos = 0
+        while True:
+            i = text.find("<", pos)
+            if i < 0:
+                self._pending = ""
+                return None
+            head = text[i:i + len(_DOCTYPE)].lower()
+            if head.startswith(_HTML_OPEN):
+                return i
+            if head == _DOCTYPE:
+                matched = match_doctype(text, i)
+                if matched:
+                    return i
+                if matched is None:
+                    self._pending = text[i:]
+                    return None
+            elif _HTML_OPEN.startswith(head) or _DOCTYPE.startswith(head):
+                # 标记被块边界截断，保留等待下一块
+                self._pending = text[i:]
+                return None
+            pos = i + 1
+
+    def _consume(self, chunk):
+        if not self._tag_closed:
+            gt = chunk.find(">")
+            if gt < 0:
+                return chunk
+            self._tag_closed = True
+            return chunk[:gt + 1] + self._consume(chunk[gt + 1:])
+        window = self._tail + chunk
+        match = _CLOSE_RE.search(window)
+        if match is not None:
+            self.finished = True
+            cut = match.end() - len(self._tail)
+            return chunk[:cut]
+        self._tail = window[-(len(_HTML_CLOSE) - 1):]
+        return chunk
@@ -0,0 +1,213 @@
+"""
+LLM response cache (opt-in).
+
+Responses are keyed by (provider, model, sys_prompt, prompt, temperature).
+Enable it by setting LLM_CACHE_BACKEND to "memory" or "sqlite"; sampled
+requests (temperature > 0) bypass the cache unless LLM_CACHE_SAMPLED=true.
+Backend calls may block (SQLite), so async callers go through alookup/astore.
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "").lower()  # "", "memory" or "sqlite"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", os.path.join("output", "llm_cache.sqlite3"))
+LLM_CACHE_SAMPLED = os.getenv("LLM_CACHE_SAMPLED", "false").lower() in ("1", "true", "yes")
+
+
+class MemoryBackend:
+    """In-process LRU backend."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[float, str] | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+            return item
+
+    def set(self, key: str, expires_at: float, value: str) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteBackend:
+    """
+    SQLite file backend, shared across worker processes on the same host.
+
+    Eviction is amortised: an estimated row count is kept per process and the
+    table is only trimmed (expired rows first, then least recently used) once
+    the estimate goes over max_entries, down to EVICT_TARGET of the cap.
+    """
+
+    EVICT_TARGET = 0.9
+
+    def __init__(self, path: str = LLM_CACHE_SQLITE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, expires_at REAL, accessed_at REAL, value TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[float, str] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row
+
+    def set(self, key: str, expires_at: float, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, expires_at, accessed_at, value) VALUES (?, ?, ?, ?)",
+                (key, expires_at, time.time(), value),
+            )
+            self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other processes write to the same file, so re-count before trimming
+        self._count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        # Trim expired rows first, then the least recently used ones
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (int(self.max_entries * self.EVICT_TARGET),),
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+
+class LLMCache:
+    """
+    Response cache in front of the LLM providers.
+
+    Args:
+        backend: Storage backend implementing get/set/delete (MemoryBackend, SQLiteBackend).
+        ttl: Seconds a cached response stays valid.
+        cache_sampled: Whether to cache requests with temperature > 0.
+    """
+
+    def __init__(self, backend, ttl: float = LLM_CACHE_TTL, cache_sampled: bool = LLM_CACHE_SAMPLED):
+        self.backend = backend
+        self.ttl = ttl
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        # Counters are updated from the event loop and from sync callers in worker threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(provider: str, model: str, sys_prompt: str | None, prompt: str, temperature: float) -> str:
+        raw = json.dumps([provider, model, sys_prompt, prompt, temperature], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, provider: str, model: str, sys_prompt: str | None, prompt: str, temperature: float) -> tuple[str | None, str | None]:
+        """
+        Returns (key, cached_value). key is None when the request bypasses the cache,
+        cached_value is None on a miss.
+        """
+        if temperature and temperature > 0 and not self.cache_sampled:
+            with self._lock:
+                self.bypassed += 1
+            return None, None
+        key = self.make_key(provider, model, sys_prompt, prompt, temperature)
+        item = self.backend.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at >= time.time():
+                with self._lock:
+                    self.hits += 1
+                logger.info(f"LLM cache hit ({provider}/{model})")
+                return key, value
+            self.backend.delete(key)
+        with self._lock:
+            self.misses += 1
+        return key, None
+
+    def store(self, key: str | None, value: str) -> None:
+        if key is None or value is None:
+            return
+        self.backend.set(key, time.time() + self.ttl, value)
+
+    async def alookup(self, provider: str, model: str, sys_prompt: str | None, prompt: str, temperature: float) -> tuple[str | None, str | None]:
+        """lookup() for async callers; the backend call runs in a worker thread."""
+        return await asyncio.to_thread(self.lookup, provider, model, sys_prompt, prompt, temperature)
+
+    async def astore(self, key: str | None, value: str) -> None:
+        """store() for async callers; the backend call runs in a worker thread."""
+        if key is None or value is None:
+            return
+        await asyncio.to_thread(self.store, key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses, bypassed = self.hits, self.misses, self.bypassed
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "bypassed": bypassed,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+_default_cache: LLMCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache | None:
+    """Returns the process-wide cache configured by LLM_CACHE_BACKEND, or None if disabled."""
+    global _default_cache
+    if LLM_CACHE_BACKEND not in ("memory", "sqlite"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            if LLM_CACHE_BACKEND == "sqlite":
+                backend = SQLiteBackend()
+            else:
+                backend = MemoryBackend()
+            _default_cache = LLMCache(backend)
+            logger.info(f"LLM response cache enabled ({LLM_CACHE_BACKEND}, ttl={LLM_CACHE_TTL}s)")
+        return _default_cache
@@ -2,9 +2,15 @@ import os
 import asyncio
 import logging
 import httpx
-from openai import OpenAI
+from contextlib import aclosing
 from dotenv import load_dotenv
 from fastapi import HTTPException # Re-import HTTPException if needed for raising errors
+from .llm_cache import LLMCache, get_llm_cache
+from .single_flight import SingleFlight
+from .metrics import timed
+from .llm_clients import get_async_http_client, get_async_openai_client
+from .llm_router import LLMRouter, Provider, UpstreamError
+from openai import APIStatusError, APITimeoutError
 load_dotenv()
 # Configure logging (can inherit from main app or configure separately)
 logger = logging.getLogger(__name__)
@@ -25,9 +31,20 @@ ARK_BASE_URL = os.getenv("ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/
 DEFAULT_ARK_MODEL = "deepseek-v3-250324"
 DEFAULT_ORIGINAL_MODEL = "ep-m-20250330105359-r7wqp" # Or "deepseek-chat" if preferred
 
+# Per-provider concurrency caps and rate limits (requests/second, 0 = unlimited)
+ARK_MAX_CONCURRENCY = int(os.getenv("ARK_MAX_CONCURRENCY", "64"))
+ARK_RATE_LIMIT = float(os.getenv("ARK_RATE_LIMIT", "0"))
+ARK_RATE_BURST = float(os.getenv("ARK_RATE_BURST", "10"))
+DEEPSEEK_MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "64"))
+DEEPSEEK_RATE_LIMIT = float(os.getenv("DEEPSEEK_RATE_LIMIT", "0"))
+DEEPSEEK_RATE_BURST = float(os.getenv("DEEPSEEK_RATE_BURST", "10"))
+
+# Identical concurrent requests share one upstream call
+_llm_flight = SingleFlight("generate_content_with_llm")
+
 # --- Internal LLM Call Functions ---
 
-async def _call_original_llm(prompt: str, model: str, temperature: float) -> str:
+async def _call_original_llm(prompt: str, model: str, temperature: float, sys_prompt: str = None) -> str:
     """Internal function to call the LLM using the original httpx method."""
     if not DEEPSEEK_API_KEY:
         logger.error("DEEPSEEK_API_KEY environment variable not set for original LLM call.")
@@ -39,41 +56,45 @@ async def _call_original_llm(prompt: str, model: str, temperature: float) -> str
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
         "Content-Type": "application/json",
     }
+    messages = []
+    if sys_prompt:
+        messages.append({"role": "system", "content": sys_prompt})
+    messages.append({"role": "user", "content": prompt})
     payload = {
         "model": model,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": messages,
         "temperature": temperature,
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            response = await client.post(DEEPSEEK_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            if data.get('choices') and len(data['choices']) > 0:
-                return data['choices'][0]['message']['content']
-            else:
-                logger.error(f"LLM API response missing expected data: {data}")
-                raise HTTPException(status_code=500, detail="Invalid LLM API response (original method)")
-        except httpx.RequestError as e:
-            logger.error(f"Error calling original LLM API: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to connect to LLM API (original method): {e}")
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Original LLM API request failed: {e.response.status_code} - {e.response.text}")
-            raise HTTPException(status_code=e.response.status_code, detail=f"LLM API error (original method): {e.response.text}")
+    client = get_async_http_client()
+    try:
+        response = await client.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=60.0)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('choices') and len(data['choices']) > 0:
+            return data['choices'][0]['message']['content']
+        else:
+            logger.error(f"LLM API response missing expected data: {data}")
+            raise HTTPException(status_code=500, detail="Invalid LLM API response (original method)")
+    except httpx.TimeoutException as e:
+        logger.error(f"Original LLM API request timed out: {e}")
+        raise HTTPException(status_code=504, detail=f"LLM API timed out (original method): {e}")
+    except httpx.RequestError as e:
+        logger.error(f"Error calling original LLM API: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to connect to LLM API (original method): {e}")
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Original LLM API request failed: {e.response.status_code} - {e.response.text}")
+        raise UpstreamError(status_code=e.response.status_code, detail=f"LLM API error (original method): {e.response.text}")
 
 async def _call_ark_llm(prompt: str, model: str, temperature: float, sys_prompt: str = None) -> str:
-    """Internal function to call the Ark LLM platform using the OpenAI client."""
+    """Internal function to call the Ark LLM platform using the async OpenAI client."""
     if not ARK_API_KEY:
         logger.error("ARK_API_KEY environment variable not set.")
         raise HTTPException(status_code=500, detail="LLM API key not configured (Ark method)")
 
     try:
-        client = OpenAI(
-            api_key=ARK_API_KEY,
-            base_url=ARK_BASE_URL,
-            timeout=1800.0, # 1800 seconds = 30 minutes
-        )
+        # Pooled client shared by all requests (30 minute timeout, keep-alive connections)
+        client = get_async_openai_client(ARK_API_KEY, ARK_BASE_URL)
 
         logger.info(f"Sending request to Ark LLM. Model: {model}, Temperature: {temperature}")
 
@@ -82,8 +103,8 @@ async def _call_ark_llm(prompt: str, model: str, temperature: float, sys_prompt:
             messages.append({"role": "system", "content": sys_prompt})
         messages.append({"role": "user", "content": prompt})
 
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
+        # Native async call: no executor thread is held, and cancelling the task aborts the upstream request
+        response = await client.chat.completions.create(
             model=model, # User specifies the Ark model ID here
             messages=messages,
             temperature=temperature
@@ -94,10 +115,72 @@ async def _call_ark_llm(prompt: str, model: str, temperature: float, sys_prompt:
 
         return response.choices[0].message.content
 
+    except APIStatusError as e: # Keep the upstream status so the router can retry 429/5xx
+        logger.error(f"Ark LLM API request failed: {e.status_code} - {e}")
+        raise UpstreamError(status_code=e.status_code, detail=f"LLM API error (Ark method): {e}")
+    except APITimeoutError as e:
+        logger.error(f"Ark LLM API request timed out: {e}")
+        raise HTTPException(status_code=504, detail=f"LLM API timed out (Ark method): {e}")
     except Exception as e: # Catch potential OpenAI client errors
         logger.error(f"Error calling Ark LLM API: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to call LLM API (Ark method): {e}")
 
+async def _stream_ark_llm(prompt: str, model: str, temperature: float, sys_prompt: str = None):
+    """Streams the Ark completion, yielding content deltas as they arrive."""
+    if not ARK_API_KEY:
+        logger.error("ARK_API_KEY environment variable not set.")
+        raise HTTPException(status_code=500, detail="LLM API key not configured (Ark method)")
+
+    client = get_async_openai_client(ARK_API_KEY, ARK_BASE_URL)
+    logger.info(f"Streaming request to Ark LLM. Model: {model}, Temperature: {temperature}")
+
+    messages = []
+    if sys_prompt:
+        messages.append({"role": "system", "content": sys_prompt})
+    messages.append({"role": "user", "content": prompt})
+
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+    except APIStatusError as e:
+        logger.error(f"Ark LLM API request failed: {e.status_code} - {e}")
+        raise UpstreamError(status_code=e.status_code, detail=f"LLM API error (Ark method): {e}")
+    except APITimeoutError as e:
+        logger.error(f"Ark LLM API request timed out: {e}")
+        raise HTTPException(status_code=504, detail=f"LLM API timed out (Ark method): {e}")
+    except Exception as e:
+        logger.error(f"Error calling Ark LLM API: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to call LLM API (Ark method): {e}")
+
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        # Closing the stream aborts the upstream request if the consumer went away early
+        await stream.close()
+
+
+def _build_router() -> LLMRouter:
+    """Ark is preferred when configured, DeepSeek is the fallback (or the only provider)."""
+    providers = []
+    if ARK_API_KEY:
+        providers.append(Provider("ark", _call_ark_llm, DEFAULT_ARK_MODEL,
+                                  ARK_MAX_CONCURRENCY, ARK_RATE_LIMIT, ARK_RATE_BURST, stream=_stream_ark_llm))
+    if DEEPSEEK_API_KEY:
+        providers.append(Provider("deepseek", _call_original_llm, DEFAULT_ORIGINAL_MODEL,
+                                  DEEPSEEK_MAX_CONCURRENCY, DEEPSEEK_RATE_LIMIT, DEEPSEEK_RATE_BURST))
+    return LLMRouter(providers)
+
+router = _build_router()
+
 
 # --- Public Function ---
 
@@ -105,9 +188,12 @@ async def generate_content_with_llm(prompt: str, model: str | None = None, tempe
     """
     Generates content using the appropriate LLM based on available API keys.
 
+    Ark is preferred when ARK_API_KEY is set; the provider router fails over to
+    DeepSeek (when configured) if Ark is saturated or keeps returning 429/5xx.
+
     Args:
         prompt: The input prompt for the LLM.
-        model: The specific model ID to use. If None, uses defaults based on API key.
+        model: The specific model ID to use on the preferred provider. If None, uses defaults based on API key.
         temperature: The generation temperature.
         sys_prompt: Optional system prompt to use for the LLM request.
 
@@ -117,17 +203,55 @@ async def generate_content_with_llm(prompt: str, model: str | None = None, tempe
     Raises:
         HTTPException: If API keys are missing or API calls fail.
     """
-    if ARK_API_KEY:
-        logger.info("ARK_API_KEY found, using Ark LLM method.")
-        effective_model = model or DEFAULT_ARK_MODEL
-        logger.info(f"Calling Ark LLM with model: {effective_model}")
-        return await _call_ark_llm(prompt, effective_model, temperature, sys_prompt)
-    elif DEEPSEEK_API_KEY:
-        logger.warning("ARK_API_KEY not found, falling back to original LLM method.")
-        effective_model = model or DEFAULT_ORIGINAL_MODEL
-        logger.info(f"Calling original LLM with model: {effective_model}")
-        # Original method doesn't support system prompt yet
-        return await _call_original_llm(prompt, effective_model, temperature)
-    else:
+    if not router.providers:
+        logger.error("Neither ARK_API_KEY nor DEEPSEEK_API_KEY are set.")
+        raise HTTPException(status_code=500, detail="No LLM API Key configured.")
+
+    # Cache and coalescing keys are based on the preferred provider; the router may fail over
+    primary = router.providers[0]
+    effective_model = model or primary.default_model
+    cache = get_llm_cache()
+    cache_key, cached = await cache.alookup(primary.name, effective_model, sys_prompt, prompt, temperature) if cache else (None, None)
+    if cached is not None:
+        return cached
+
+    flight_key = LLMCache.make_key(primary.name, effective_model, sys_prompt, prompt, temperature)
+    with timed("llm_call"):
+        content = await _llm_flight.do(flight_key, lambda: router.generate(prompt, model, temperature, sys_prompt))
+
+    if cache:
+        await cache.astore(cache_key, content)
+    return content
+
+
+async def stream_content_with_llm(prompt: str, model: str | None = None, temperature: float = 0.7, sys_prompt: str = None):
+    """
+    Streaming counterpart of generate_content_with_llm, yielding content deltas.
+
+    Goes through the same provider router (concurrency caps, rate limits, retries
+    and failover before the first delta). A cached response is yielded as a single
+    chunk; a freshly streamed one is cached once the stream completes.
+
+    Raises:
+        HTTPException: If API keys are missing or API calls fail.
+    """
+    if not router.providers:
         logger.error("Neither ARK_API_KEY nor DEEPSEEK_API_KEY are set.")
         raise HTTPException(status_code=500, detail="No LLM API Key configured.")
+
+    primary = router.providers[0]
+    effective_model = model or primary.default_model
+    cache = get_llm_cache()
+    cache_key, cached = await cache.alookup(primary.name, effective_model, sys_prompt, prompt, temperature) if cache else (None, None)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async with aclosing(router.stream(prompt, model, temperature, sys_prompt)) as chunks:
+        async for delta in chunks:
+            parts.append(delta)
+            yield delta
+
+    if cache:
+        await cache.astore(cache_key, "".join(parts))
@@ -0,0 +1,136 @@
+"""
+Shared HTTP / OpenAI client registry for all LLM calls.
+
+Clients keep connections alive across requests so each LLM call no longer
+pays TCP+TLS setup. The FastAPI lifespan calls startup()/shutdown(); scripts
+that never call startup() get clients created lazily on first use.
+"""
+import os
+import logging
+import threading
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "1800"))  # 1800 seconds = 30 minutes
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+try:
+    import h2  # noqa: F401  httpx needs the h2 package for HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+USE_HTTP2 = LLM_HTTP2 and HTTP2_AVAILABLE
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class ClientRegistry:
+    """Holds one pooled async httpx client, one sync httpx client and the OpenAI clients built on them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async_http: httpx.AsyncClient | None = None
+        self._sync_http: httpx.Client | None = None
+        self._openai: dict[tuple[str, str], OpenAI] = {}
+        self._async_openai: dict[tuple[str, str], AsyncOpenAI] = {}
+
+    def async_http(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async_http is None or self._async_http.is_closed:
+                self._async_http = httpx.AsyncClient(
+                    timeout=LLM_HTTP_TIMEOUT, limits=_limits(), http2=USE_HTTP2
+                )
+                self._async_openai.clear()  # bound to the old transport
+            return self._async_http
+
+    def sync_http(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_http is None or self._sync_http.is_closed:
+                self._sync_http = httpx.Client(
+                    timeout=LLM_HTTP_TIMEOUT, limits=_limits(), http2=USE_HTTP2
+                )
+                self._openai.clear()  # bound to the old transport
+            return self._sync_http
+
+    def openai(self, api_key: str, base_url: str) -> OpenAI:
+        http_client = self.sync_http()
+        with self._lock:
+            client = self._openai.get((api_key, base_url))
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=LLM_HTTP_TIMEOUT,
+                    http_client=http_client,
+                )
+                self._openai[(api_key, base_url)] = client
+            return client
+
+    def async_openai(self, api_key: str, base_url: str) -> AsyncOpenAI:
+        http_client = self.async_http()
+        with self._lock:
+            client = self._async_openai.get((api_key, base_url))
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=LLM_HTTP_TIMEOUT,
+                    http_client=http_client,
+                )
+                self._async_openai[(api_key, base_url)] = client
+            return client
+
+    async def aclose(self) -> None:
+        with self._lock:
+            async_http, self._async_http = self._async_http, None
+            sync_http, self._sync_http = self._sync_http, None
+            self._openai.clear()
+            self._async_openai.clear()
+        if async_http is not None:
+            await async_http.aclose()
+        if sync_http is not None:
+            sync_http.close()
+
+
+registry = ClientRegistry()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    return registry.async_http()
+
+
+def get_openai_client(api_key: str, base_url: str) -> OpenAI:
+    return registry.openai(api_key, base_url)
+
+
+def get_async_openai_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    return registry.async_openai(api_key, base_url)
+
+
+async def startup() -> None:
+    """Creates the pooled clients up front (called from the FastAPI lifespan)."""
+    registry.async_http()
+    registry.sync_http()
+    if LLM_HTTP2 and not HTTP2_AVAILABLE:
+        logger.info("h2 package not installed, LLM clients fall back to HTTP/1.1")
+    logger.info(
+        f"LLM client pool ready: max_connections={LLM_HTTP_MAX_CONNECTIONS}, "
+        f"keepalive={LLM_HTTP_MAX_KEEPALIVE}, http2={USE_HTTP2}"
+    )
+
+
+async def shutdown() -> None:
+    """Closes pooled connections (called from the FastAPI lifespan)."""
+    await registry.aclose()
@@ -1,9 +1,12 @@
 import os
 import logging
-from openai import OpenAI
 from dotenv import load_dotenv
 from .prompt_config import SYSTEM_PROMPT_WEB_DESIGNER, USER_PROMPT_WEB_DESIGNER, SYSTEM_PROMPT_SUMMARIZE_2MD
-import re
+from .metrics import timed
+from .llm_cache import LLMCache, get_llm_cache
+from .single_flight import SingleFlight
+from .llm_clients import get_openai_client
+from .html_extractor import extract_html
 
 # Load environment variables from a .env file if present
 load_dotenv()
@@ -12,6 +15,8 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Identical concurrent requests share one upstream call
+_ark_sync_flight = SingleFlight("call_ark_llm")
 
 
 def call_ark_llm(prompt: str, sys_prompt:str = SYSTEM_PROMPT_WEB_DESIGNER,model_id: str = "deepseek-v3-250324", temperature: float = 0.7) -> str:
@@ -40,26 +45,30 @@ def call_ark_llm(prompt: str, sys_prompt:str = SYSTEM_PROMPT_WEB_DESIGNER,model_
         logger.error("ARK_API_KEY environment variable not found.")
         raise ValueError("ARK_API_KEY environment variable must be set.")
 
+    # Serve byte-identical requests from the response cache when it is enabled
+    cache = get_llm_cache()
+    cache_key, cached = cache.lookup("ark", model_id, sys_prompt, prompt, temperature) if cache else (None, None)
+    if cached is not None:
+        return cached
+
     try:
-        client = OpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            # Set a long timeout as recommended for potentially long-running models
-            timeout=1800.0, # 1800 seconds = 30 minutes
-        )
+        # Reuse the pooled client; it carries the long timeout recommended for slow models
+        client = get_openai_client(api_key, base_url)
         
         logger.info(f"Sending request to Ark LLM. Model: {model_id}, Temperature: {temperature}")
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=[
-                # You can add a system prompt here if needed:
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature,
-            # Add other parameters like max_tokens if necessary
-            # max_tokens=1024,
-        )
+        flight_key = LLMCache.make_key("ark", model_id, sys_prompt, prompt, temperature)
+        with timed("llm_call"):
+            response = _ark_sync_flight.do_sync(flight_key, lambda: client.chat.completions.create(
+                model=model_id,
+                messages=[
+                    # You can add a system prompt here if needed:
+                    {"role": "system", "content": sys_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                # Add other parameters like max_tokens if necessary
+                # max_tokens=1024,
+            ))
 
         message = response.choices[0].message
 
@@ -74,6 +83,8 @@ def call_ark_llm(prompt: str, sys_prompt:str = SYSTEM_PROMPT_WEB_DESIGNER,model_
 
         content = message.content
         logger.info("Successfully received response from Ark LLM.")
+        if cache:
+            cache.store(cache_key, content)
         return content
 
     except Exception as e:
@@ -91,29 +102,8 @@ def extract_html_from_response(response_text):
     返回:
         提取出的HTML内容，如果没有找到则返回原始文本
     """
-    # 尝试匹配完整的HTML文档（从<!DOCTYPE>或<html>开始到</html>结束）
-    html_pattern = r'(?:<!DOCTYPE\s+html[^>]*>|<html[^>]*>)[\s\S]*?</html>'
-    match = re.search(html_pattern, response_text, re.IGNORECASE)
-    
-    if match:
-        return match.group(0)
-    
-    # 如果没有找到完整HTML，尝试匹配被代码块包围的HTML
-    code_block_pattern = r'```(?:html)?\s*((?:<!DOCTYPE\s+html[^>]*>|<html[^>]*>)[\s\S]*?</html>)\s*```'
-    match = re.search(code_block_pattern, response_text, re.IGNORECASE)
-    
-    if match:
-        return match.group(1)
-    
-    # 如果仍然没有找到，尝试匹配任何HTML片段
-    html_fragment_pattern = r'<[^>]+>[\s\S]*?</[^>]+>'
-    match = re.search(html_fragment_pattern, response_text)
-    
-    if match:
-        return match.group(0)
-    
-    # 如果所有模式都没有匹配，返回原始文本
-    return response_text
+    # 单遍线性扫描（完整文档 > 代码块 > HTML片段），避免正则在畸形长输出上回溯
+    return extract_html(response_text)
 
 # --- Example Usage ---
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+"""
+Provider router for LLM calls.
+
+Each provider gets a concurrency cap (semaphore), a token-bucket rate limit,
+jittered exponential backoff on 429/5xx and a cooldown after repeated
+failures. Calls go to the preferred provider and fail over to the next one
+when it is saturated or down. Rolling latency stats are kept per provider.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import aclosing
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_PROVIDER_COOLDOWN = float(os.getenv("LLM_PROVIDER_COOLDOWN", "30"))
+LLM_PROVIDER_FAILURE_THRESHOLD = int(os.getenv("LLM_PROVIDER_FAILURE_THRESHOLD", "3"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+
+class UpstreamError(HTTPException):
+    """An error status answered by the provider itself, as opposed to a timeout or local failure."""
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """
+    Only 429/5xx answered by the provider are retried or failed over.
+
+    Timeouts and client-side errors are not: the client read timeout is very long,
+    so retrying a hung call would multiply the worst-case latency.
+    """
+    if not isinstance(exc, UpstreamError):
+        return False
+    return exc.status_code == 429 or exc.status_code >= 500
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def has_token(self) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill()
+        return self._tokens >= 1
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Provider:
+    """
+    Args:
+        name: Provider name ("ark", "deepseek").
+        call: async fn(prompt, model, temperature, sys_prompt) -> str.
+        stream: Optional async generator fn(prompt, model, temperature, sys_prompt) yielding
+            content deltas. Providers without one stream their full response as a single chunk.
+        default_model: Model used when the caller did not pick one for this provider.
+        max_concurrency: Maximum in-flight requests.
+        rate: Requests per second allowed (0 disables rate limiting).
+        burst: Token-bucket capacity.
+    """
+
+    def __init__(self, name: str, call, default_model: str, max_concurrency: int, rate: float, burst: float,
+                 stream=None):
+        self.name = name
+        self.call = call
+        self.stream = stream
+        self.default_model = default_model
+        self.max_concurrency = max(1, max_concurrency)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.latencies: deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+
+    @property
+    def is_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.in_flight >= self.max_concurrency or not self.bucket.has_token()
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.latencies.append(latency)
+
+    def record_failure(self, retryable: bool):
+        self.failures += 1
+        if not retryable:
+            return
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= LLM_PROVIDER_FAILURE_THRESHOLD:
+            self.cooldown_until = time.monotonic() + LLM_PROVIDER_COOLDOWN
+            logger.warning(f"LLM provider '{self.name}' marked down for {LLM_PROVIDER_COOLDOWN}s")
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else None
+
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "down": self.is_down,
+            "latency_avg": sum(ordered) / len(ordered) if ordered else None,
+            "latency_p50": pct(0.5),
+            "latency_p95": pct(0.95),
+        }
+
+
+class LLMRouter:
+    """Routes calls over an ordered list of providers (first one is preferred)."""
+
+    def __init__(self, providers: list[Provider]):
+        self.providers = providers
+        self.failovers = 0
+
+    def _candidates(self) -> list[Provider]:
+        up = [p for p in self.providers if not p.is_down]
+        if not up:
+            return list(self.providers)
+        # Prefer providers with spare capacity, keeping the configured order otherwise
+        return sorted(up, key=lambda p: p.is_saturated)
+
+    async def _call_provider(self, provider: Provider, prompt: str, model: str, temperature: float, sys_prompt: str | None) -> str:
+        async with provider.semaphore:
+            provider.in_flight += 1
+            try:
+                for attempt in range(LLM_MAX_RETRIES + 1):
+                    await provider.bucket.acquire()
+                    start = time.monotonic()
+                    try:
+                        result = await provider.call(prompt, model, temperature, sys_prompt)
+                    except Exception as e:
+                        if not _is_retryable(e) or attempt == LLM_MAX_RETRIES:
+                            raise
+                        provider.retries += 1
+                        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+                        logger.warning(f"LLM provider '{provider.name}' failed ({e}), retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    provider.record_success(time.monotonic() - start)
+                    return result
+            finally:
+                provider.in_flight -= 1
+
+    async def generate(self, prompt: str, model: str | None, temperature: float, sys_prompt: str | None = None) -> str:
+        """
+        Calls the best available provider, failing over on retryable errors.
+
+        `model` only applies to the preferred provider; fallbacks use their default model.
+        """
+        if not self.providers:
+            raise HTTPException(status_code=500, detail="No LLM API Key configured.")
+        last_error: Exception | None = None
+        for provider in self._candidates():
+            is_primary = provider is self.providers[0]
+            effective_model = (model if is_primary else None) or provider.default_model
+            if not is_primary:
+                self.failovers += 1
+                logger.warning(f"Failing over to LLM provider '{provider.name}'")
+            logger.info(f"Calling LLM provider '{provider.name}' with model: {effective_model}")
+            try:
+                return await self._call_provider(provider, prompt, effective_model, temperature, sys_prompt)
+            except Exception as e:
+                retryable = _is_retryable(e)
+                provider.record_failure(retryable)
+                last_error = e
+                if not retryable:
+                    raise
+        raise last_error
+
+    async def _provider_chunks(self, provider: Provider, prompt: str, model: str, temperature: float, sys_prompt: str | None):
+        if provider.stream is None:
+            yield await provider.call(prompt, model, temperature, sys_prompt)
+            return
+        async with aclosing(provider.stream(prompt, model, temperature, sys_prompt)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    async def _stream_provider(self, provider: Provider, prompt: str, model: str, temperature: float, sys_prompt: str | None):
+        async with provider.semaphore:
+            provider.in_flight += 1
+            try:
+                for attempt in range(LLM_MAX_RETRIES + 1):
+                    await provider.bucket.acquire()
+                    start = time.monotonic()
+                    started = False
+                    try:
+                        async with aclosing(self._provider_chunks(provider, prompt, model, temperature, sys_prompt)) as chunks:
+                            async for chunk in chunks:
+                                started = True
+                                yield chunk
+                    except Exception as e:
+                        # Once output has reached the caller the request can no longer be replayed
+                        if started or not _is_retryable(e) or attempt == LLM_MAX_RETRIES:
+                            raise
+                        provider.retries += 1
+                        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+                        logger.warning(f"LLM provider '{provider.name}' failed ({e}), retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    provider.record_success(time.monotonic() - start)
+                    return
+            finally:
+                provider.in_flight -= 1
+
+    async def stream(self, prompt: str, model: str | None, temperature: float, sys_prompt: str | None = None):
+        """
+        Streaming counterpart of generate(), yielding content deltas.
+
+        Retries and failover only happen before the first delta is yielded; a
+        failure mid-stream is raised to the caller.
+        """
+        if not self.providers:
+            raise HTTPException(status_code=500, detail="No LLM API Key configured.")
+        last_error: Exception | None = None
+        for provider in self._candidates():
+            is_primary = provider is self.providers[0]
+            effective_model = (model if is_primary else None) or provider.default_model
+            if not is_primary:
+                self.failovers += 1
+                logger.warning(f"Failing over to LLM provider '{provider.name}'")
+            logger.info(f"Streaming from LLM provider '{provider.name}' with model: {effective_model}")
+            started = False
+            try:
+                async with aclosing(self._stream_provider(provider, prompt, effective_model, temperature, sys_prompt)) as chunks:
+                    async for chunk in chunks:
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                retryable = _is_retryable(e)
+                provider.record_failure(retryable)
+                last_error = e
+                if started or not retryable:
+                    raise
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "providers": {p.name: p.stats() for p in self.providers},
+        }
@@ -0,0 +1,149 @@
+"""
+进程内的 Prometheus 风格指标。
+
+- Histogram: 各阶段耗时（LLM 调用、HTML 提取、写文件、借浏览器、页面加载、截图、卡片提取）
+- 仪表 (gauge): 通过 register_collector 注册的回调在抓取时现算，如队列深度、池利用率、缓存命中率
+- Server-Timing: 请求处理期间 timed() 记录的阶段耗时可以汇总成响应头
+
+不依赖 prometheus_client，render() 直接输出文本格式 (text/plain; version=0.0.4)。
+回调可以是协程函数，需要查 SQLite 等阻塞操作时应在其中用 asyncio.to_thread，不要阻塞事件循环。
+"""
+import time
+import bisect
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_collectors = []
+_request_timings: ContextVar[list | None] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    参数:
+        name: 指标名
+        help: 说明文字
+        labelnames: 标签名元组
+        buckets: 桶上界（秒），自动补上 +Inf
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # 标签值元组 -> [各桶计数..., +Inf 计数, 总和]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in sorted(items):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": _format_value(float(bound))})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("card_stage_seconds", "Latency of each card pipeline stage in seconds.", ("stage",))
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "HTTP request latency in seconds.", ("method", "route", "status"))
+
+
+@contextmanager
+def timed(stage):
+    """记录一个阶段的耗时；在请求上下文中同时计入 Server-Timing。同步和异步代码中都可使用"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def register_collector(fn):
+    """
+    注册仪表回调：fn() 返回 [(指标名, 说明, 标签字典, 数值), ...]，每次抓取时调用。
+    fn 可以是协程函数。以 _total 结尾的指标按 counter 类型输出。
+    """
+    _collectors.append(fn)
+    return fn
+
+
+async def render():
+    """输出所有指标的 Prometheus 文本格式"""
+    lines = []
+    for histogram in _registry:
+        lines.extend(histogram.render())
+    gauges = {}
+    for collector in _collectors:
+        samples = collector()
+        if inspect.isawaitable(samples):
+            samples = await samples
+        for name, help, labels, value in samples:
+            gauges.setdefault(name, (help, []))[1].append((labels, value))
+    for name, (help, samples) in gauges.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def start_request_timing():
+    """为当前请求开始收集阶段耗时，返回收集用的列表（asyncio.to_thread 中记录的耗时也会汇入）"""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def format_server_timing(timings, total=None):
+    """把收集到的阶段耗时格式化为 Server-Timing 头，同名阶段的耗时累加"""
+    merged = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,164 @@
+"""
+基于内容寻址的渲染结果缓存。
+
+缓存键由 HTML 字节、视口宽度、设备像素比和卡片提取参数共同哈希得到，
+相同的卡片直接从磁盘返回，不再重复启动浏览器渲染。
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join("output", ".render_cache"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_SUFFIX = ".png"
+
+
+def make_render_key(html, width, pixel_ratio, extractor_params=None):
+    """
+    计算渲染缓存键。
+
+    参数:
+        html: HTML 内容（str 或 bytes）
+        width: 视口宽度
+        pixel_ratio: 设备像素比
+        extractor_params: 卡片提取参数字典，None 表示不做提取
+    """
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    digest = hashlib.sha256(html)
+    params = {"width": width, "pixel_ratio": pixel_ratio, "extractor": extractor_params}
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    磁盘 LRU 缓存，总大小超过 max_bytes 时淘汰最久未使用的条目。
+
+    写入先落到同目录临时文件再 os.replace，读者不会看到半写入的文件。
+    """
+
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size，按最近使用排序
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    def _load_index(self):
+        """启动时按 mtime 重建 LRU 顺序"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name[:-len(_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """命中时返回缓存文件路径，否则返回 None"""
+        with self._lock:
+            if key in self._entries and os.path.exists(self._path(key)):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                path = self._path(key)
+            else:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+        try:
+            os.utime(path)  # 让重启后的 LRU 顺序也正确
+        except OSError:
+            pass
+        return path
+
+    def put_file(self, key, src_path):
+        """把已生成的文件原子地写入缓存，返回缓存文件路径"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._record(key, os.path.getsize(self._path(key)))
+        return self._path(key)
+
+    def put_bytes(self, key, data):
+        """把字节内容原子地写入缓存，返回缓存文件路径"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._record(key, len(data))
+        return self._path(key)
+
+    def _record(self, key, size):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+        if evicted:
+            logger.info(f"渲染缓存淘汰 {len(evicted)} 个条目")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """获取进程内共享的默认渲染缓存（懒加载）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RenderCache()
+        return _default_cache
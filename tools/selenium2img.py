@@ -1,92 +1,162 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import time
 import os
-from .card_extractor import extract_card_from_image
+import shutil
+from .card_extractor import CARD_DETECT_WIDTH, extract_card_from_image, extract_card_in_pool
+from .render_cache import get_render_cache, make_render_key
+from .single_flight import SingleFlight
+from .metrics import timed
+from .browser_pool import (
+    CARD_CLIP_MARGIN,
+    CARD_SELECTORS,
+    DEFAULT_HEIGHT,
+    DEFAULT_PIXEL_RATIO,
+    capture_clip,
+    find_card_rect,
+    get_browser_pool,
+    measure_page_height,
+    set_viewport,
+    wait_until_ready,
+)
 
-def html_to_image(html_path, output_path, width=393, height=None):
+# Locate the card via the DOM when rendering cards; OpenCV extraction is only the fallback
+RENDER_DOM_CLIP = os.getenv("RENDER_DOM_CLIP", "1").lower() not in ("0", "false", "no")
+
+_render_flight = SingleFlight("render_card")
+
+def render_png(html_path, width=393, height=None, pool=None, pixel_ratio=DEFAULT_PIXEL_RATIO, clip_card=False):
+    """
+    Renders HTML file in a pooled headless Chrome (mobile emulation) and returns
+    (PNG bytes or None on failure, whether the image was clipped to the card element).
+
+    With clip_card, the card element is located via the DOM (getBoundingClientRect over
+    CARD_SELECTORS) and only that region is captured; when no element matches, the full
+    page is captured so the caller can fall back to pixel-based extraction.
+    """
+    pool = pool or get_browser_pool()
+
+    # Convert to absolute path if it's a local file
+    if not html_path.startswith('http'):
+        html_path = 'file://' + os.path.abspath(html_path)
+
+    try:
+        # Mobile emulation (iPhone 15, 3x pixel ratio) is applied per tab via CDP
+        with pool.tab(width=width, height=height or DEFAULT_HEIGHT, pixel_ratio=pixel_ratio) as driver:
+            with timed("page_load"):
+                driver.get(html_path)
+                # Wait for document ready and web fonts instead of a fixed sleep
+                wait_until_ready(driver)
+
+                # Dynamically calculate height if needed
+                if height is None:
+                    calculated_height = measure_page_height(driver)
+                    print(f"自适应内容高度: {calculated_height}像素")
+                    # Resize the viewport in place; no relaunch or reload required
+                    set_viewport(driver, width, calculated_height, pixel_ratio)
+                    wait_until_ready(driver)
+
+            with timed("screenshot"):
+                if clip_card:
+                    rect = find_card_rect(driver)
+                    if rect:
+                        print(f"通过 DOM 定位卡片 ({rect['selector']}): {rect['width']:.0f}x{rect['height']:.0f}")
+                        return capture_clip(driver, rect), True
+                    print("未通过 DOM 找到卡片元素，截取整页")
+
+                # Capture screenshot
+                return driver.get_screenshot_as_png(), False
+
+    except Exception as e:
+        print(f"Error converting HTML to image: {e}")
+        return None, False
+
+def html_to_png(html_path, width=393, height=None, pool=None, pixel_ratio=DEFAULT_PIXEL_RATIO, clip_card=False):
+    """
+    Same as render_png, but returns only the PNG bytes (None on failure). Nothing is written to disk.
+    """
+    return render_png(html_path, width=width, height=height, pool=pool, pixel_ratio=pixel_ratio, clip_card=clip_card)[0]
+
+def html_to_image(html_path, output_path, width=393, height=None, pool=None, pixel_ratio=DEFAULT_PIXEL_RATIO, clip_card=False):
     """
-    Renders HTML file to an image using Selenium and Chrome, emulating a mobile device.
+    Renders HTML file to an image using a pooled headless Chrome, emulating a mobile device.
     
     Parameters:
         html_path: Path to HTML file or URL
         output_path: Path to save the output image
         width: Width of the viewport in pixels (default: 393px - iPhone 15 width)
         height: Height of the viewport in pixels (None for auto, dynamically calculated)
+        pool: BrowserPool to render in (None uses the shared default pool)
+        pixel_ratio: Device scale factor of the emulated screen (default: 3.0 - iPhone 15)
+        clip_card: Capture only the card element located via the DOM (full page if not found)
     """
-    # Configure Chrome options
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Run in headless mode
-    chrome_options.add_argument("--disable-gpu")
-    # Remove specific window size and user agent as mobile emulation handles this
-    # chrome_options.add_argument(f"--window-size={width},{height or 852}")
-    # chrome_options.add_argument("--user-agent=Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1")
-    chrome_options.add_argument("--hide-scrollbars")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--force-device-scale-factor=2") # Keep high DPI
-
-    # Define mobile emulation settings for iPhone 15
-    mobile_emulation = {
-        "deviceMetrics": {
-            "width": width,
-            "height": height or 852,  # Use a default height if not dynamic
-            "pixelRatio": 3.0 # iPhone 15 has a 3x pixel ratio
-        },
-        "userAgent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
-    }
-    chrome_options.add_experimental_option("mobileEmulation", mobile_emulation)
-    
-    try:
-        # Initialize the driver with mobile emulation options
-        driver = webdriver.Chrome(options=chrome_options)
-        
-        # Convert to absolute path if it's a local file
-        if not html_path.startswith('http'):
-            html_path = 'file://' + os.path.abspath(html_path)
-        
-        # Load the page
-        driver.get(html_path)
-        
-        # Wait for page rendering and any JavaScript execution
-        time.sleep(2)
-        
-        # Dynamically calculate height if needed
-        if height is None:
-            # Calculate the full page height
-            calculated_height = driver.execute_script("""
-                return Math.max(
-                    document.body.scrollHeight, 
-                    document.documentElement.scrollHeight,
-                    document.body.offsetHeight, 
-                    document.documentElement.offsetHeight,
-                    document.body.clientHeight,
-                    document.documentElement.clientHeight
-                );
-            """)
-            print(f"自适应内容高度: {calculated_height}像素")
-            
-            # Update mobile emulation height and re-initialize driver for correct height
-            # Note: Re-initializing is necessary because mobileEmulation height is set at launch
-            driver.quit() # Close the current driver
-            mobile_emulation["deviceMetrics"]["height"] = calculated_height
-            chrome_options.add_experimental_option("mobileEmulation", mobile_emulation)
-            driver = webdriver.Chrome(options=chrome_options) # Re-launch with correct height
-            driver.get(html_path) # Reload page
-            time.sleep(1) # Wait for reload
-
-        # Capture screenshot
-        driver.save_screenshot(output_path)
+    png = html_to_png(html_path, width=width, height=height, pool=pool, pixel_ratio=pixel_ratio, clip_card=clip_card)
+    if png is None:
+        return False
+    with open(output_path, 'wb') as f:
+        f.write(png)
+    print(f"Image saved to {output_path}")
+    return True
+
+def render_card(html_path, output_path, width=393, pixel_ratio=DEFAULT_PIXEL_RATIO, min_area=500, extract=True, cache=None):
+    """
+    Renders a local HTML file and crops the card out of the screenshot, serving
+    identical (HTML, viewport, extractor params) combinations from the render cache.
+
+    Parameters:
+        html_path: Path to a local HTML file
+        output_path: Path to save the final card image
+        width: Width of the viewport in pixels
+        pixel_ratio: Device scale factor of the emulated screen
+        min_area: min_area passed to extract_card_from_image
+        extract: Whether to crop the card (False keeps the full screenshot)
+        cache: RenderCache to use (None uses the shared default cache)
+    """
+    cache = cache or get_render_cache()
+    with open(html_path, 'rb') as f:
+        html_bytes = f.read()
+    extractor_params = {
+        "min_area": min_area,
+        "detect_width": CARD_DETECT_WIDTH,
+        "dom_clip": [CARD_SELECTORS, CARD_CLIP_MARGIN] if RENDER_DOM_CLIP else None,
+    } if extract else None
+    key = make_render_key(html_bytes, width, pixel_ratio, extractor_params)
+
+    cached_path = cache.get(key)
+    if cached_path:
+        try:
+            shutil.copyfile(cached_path, output_path)
+            print(f"Render cache hit, image copied to {output_path}")
+            return True
+        except FileNotFoundError:
+            # Evicted by another thread/process between get() and the copy: treat as a miss
+            pass
+
+    # Concurrent renders of the same card share one browser render; the others copy its result.
+    # The fresh entry can itself be evicted before we copy it, so allow one re-render
+    for _ in range(2):
+        cached_path = _render_flight.do_sync(
+            key, lambda: _render_to_cache(html_path, key, width, pixel_ratio, min_area, extract, cache)
+        )
+        if not cached_path:
+            return False
+        try:
+            shutil.copyfile(cached_path, output_path)
+        except FileNotFoundError:
+            continue
         print(f"Image saved to {output_path}")
         return True
-    
-    except Exception as e:
-        print(f"Error converting HTML to image: {e}")
-        return False
-    
-    finally:
-        if 'driver' in locals():
-            driver.quit()
+    return False
+
+def _render_to_cache(html_path, key, width, pixel_ratio, min_area, extract, cache):
+    """Renders one card into the render cache and returns the cached path (None on failure)."""
+    # The screenshot stays in memory. When the card is clipped via the DOM, OpenCV is skipped;
+    # otherwise card extraction runs in the OpenCV process pool
+    png, clipped = render_png(html_path, width=width, pixel_ratio=pixel_ratio, clip_card=extract and RENDER_DOM_CLIP)
+    if png is None:
+        return None
+    if extract and not clipped:
+        png, _ = extract_card_in_pool(png, min_area=min_area)
+        if png is None:
+            return None
+    return cache.put_bytes(key, png)
 
 # Only run example code when this file is executed directly, not when imported
 if __name__ == "__main__":
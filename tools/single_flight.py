@@ -0,0 +1,94 @@
+"""
+Request coalescing (single-flight).
+
+Concurrent callers asking for the same key share one execution instead of
+each firing its own upstream request. SingleFlight.do() is for coroutines,
+SingleFlight.do_sync() for blocking work running in threads.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_registry: dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """
+    Args:
+        name: Name used in logs and stats.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executed = 0
+        self.coalesced = 0
+        self._tasks: dict[str, tuple[asyncio.Task, list[int]]] = {}
+        self._futures: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    async def do(self, key: str, coro_factory):
+        """
+        Runs coro_factory() once per key among concurrent callers and returns its result.
+
+        The shared task is only cancelled when every waiting caller has been cancelled,
+        so one client disconnecting does not abort the work for the others.
+        """
+        entry = self._tasks.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(coro_factory())
+            entry = (task, [0])
+            self._tasks[key] = entry
+            task.add_done_callback(lambda _t: self._tasks.pop(key, None) if self._tasks.get(key) is entry else None)
+            self.executed += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"[{self.name}] coalesced request onto in-flight call")
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and waiters[0] == 1:
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def do_sync(self, key: str, fn):
+        """Runs fn() once per key among concurrent threads and returns its result."""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._futures[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            logger.info(f"[{self.name}] coalesced request onto in-flight call")
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._tasks) + len(self._futures),
+        }
+
+
+def all_stats() -> dict:
+    """Stats of every SingleFlight instance, keyed by name."""
+    return {name: flight.stats() for name, flight in _registry.items()}
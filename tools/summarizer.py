@@ -0,0 +1,187 @@
+"""
+长文总结：按 token 预算分块的 map-reduce。
+
+- 分块: 先按 Markdown 标题切分章节，再按段落、句子装箱，每块不超过 SUMMARY_CHUNK_TOKENS
+- map:  各块并行总结（并发不超过 SUMMARY_MAX_CONCURRENCY），得到要点
+- reduce: 用 SYSTEM_PROMPT_SUMMARIZE_2MD 把各块要点汇总成最终摘要；
+          要点合计仍超出预算时先分组再总结一轮
+
+总延迟取决于最长的一块而不是整篇文档。短文直接单次总结，与原先行为一致。
+"""
+import os
+import re
+import asyncio
+import logging
+
+from .llm_caller import generate_content_with_llm
+from .prompt_config import SYSTEM_PROMPT_SUMMARIZE_2MD, SYSTEM_PROMPT_SUMMARIZE_CHUNK
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+SUMMARY_MAX_REDUCE_ROUNDS = int(os.getenv("SUMMARY_MAX_REDUCE_ROUNDS", "3"))
+SUMMARY_TEMPERATURE = 0.5
+
+_HEADING_RE = re.compile(r"^#{1,6}\s")
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_SENTENCE_RE = re.compile(r"(?<=[。！？!?；;\.])\s*|\n")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 个 token，其余约 4 个字符 1 个 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _sections(text):
+    """按 Markdown 标题切分，返回 [(标题行, 正文)]，标题前的内容标题行为空"""
+    sections, heading, lines = [], "", []
+    in_code = False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        if not in_code and _HEADING_RE.match(line):
+            if heading or any(l.strip() for l in lines):
+                sections.append((heading, "\n".join(lines).strip()))
+            heading, lines = line.strip(), []
+        else:
+            lines.append(line)
+    if heading or any(l.strip() for l in lines):
+        sections.append((heading, "\n".join(lines).strip()))
+    return sections
+
+
+def _pieces(body, max_tokens):
+    """把章节正文拆成不超过 max_tokens 的片段：段落 -> 句子 -> 按字符硬切"""
+    for paragraph in re.split(r"\n\s*\n", body):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if estimate_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+            # 没有标点的超长文本：按估算比例切分字符；中日韩字符分布不均时逐段收缩直到不超预算
+            step = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+            start = 0
+            while start < len(sentence):
+                end = min(len(sentence), start + step)
+                while end - start > 1 and (tokens := estimate_tokens(sentence[start:end])) > max_tokens:
+                    end = start + max(1, (end - start) * max_tokens // tokens)
+                yield sentence[start:end]
+                start = end
+
+
+def split_markdown(text, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """
+    把 Markdown 文本切成 token 数不超过 max_tokens 的块，尽量在标题与段落处断开。
+
+    同一章节被拆成多块时，后续块开头补上章节标题，保留上下文。
+    块内的 "\n\n" 分隔符和补上的标题都计入预算（估算按片段累加，只会偏高）。
+    """
+    sep_tokens = estimate_tokens("\n\n")
+    chunks, current, current_tokens = [], [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        current, current_tokens = [], 0
+
+    for heading, body in _sections(text):
+        if heading and estimate_tokens(heading) + sep_tokens > max_tokens // 2:
+            # 标题本身就占去大半预算：当作正文切分，不再在后续块重复
+            heading, body = "", f"{heading}\n\n{body}"
+        heading_tokens = estimate_tokens(heading) + sep_tokens if heading else 0
+        budget = max(1, max_tokens - heading_tokens)
+        for i, piece in enumerate(list(_pieces(body, budget)) or [""]):
+            tokens = estimate_tokens(piece) + (heading_tokens if i == 0 else 0)
+            if current and current_tokens + sep_tokens + tokens > max_tokens:
+                flush()
+            # 章节首块带标题；章节拆到新块时重复标题
+            with_heading = heading and (i == 0 or not current)
+            if with_heading:
+                tokens = estimate_tokens(piece) + heading_tokens
+            block = "\n\n".join(p for p in (heading if with_heading else "", piece) if p)
+            current_tokens += tokens + (sep_tokens if current else 0)
+            current.append(block)
+    flush()
+    return chunks
+
+
+def _single_prompt(content):
+    return f"""请对以下内容进行简洁明了的总结，突出关键信息，保持语言简练：
+
+{content}
+
+总结：
+"""
+
+
+async def _summarize_chunks(chunks, model, semaphore, label):
+    async def one(index, chunk):
+        prompt = f"以下是{label}的第 {index + 1}/{len(chunks)} 部分，请总结其要点：\n\n{chunk}\n\n要点总结："
+        async with semaphore:
+            return await generate_content_with_llm(
+                prompt=prompt,
+                sys_prompt=SYSTEM_PROMPT_SUMMARIZE_CHUNK,
+                model=model,
+                temperature=SUMMARY_TEMPERATURE,
+            )
+
+    # 任一块失败时 TaskGroup 会取消其余仍在进行的调用，不再白白占用并发和配额
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(one(i, chunk)) for i, chunk in enumerate(chunks)]
+    except ExceptionGroup as eg:
+        raise eg.exceptions[0]
+    return [task.result().strip() for task in tasks]
+
+
+async def summarize(content, model=None, max_chunk_tokens=SUMMARY_CHUNK_TOKENS, max_concurrency=SUMMARY_MAX_CONCURRENCY):
+    """
+    总结任意长度的内容，返回 Markdown 摘要。
+
+    参数:
+        content: 待总结的文本（通常是 /api/fetch-web 抓到的 Markdown）
+        model: 指定模型，None 使用默认模型
+        max_chunk_tokens: 每块的 token 上限
+        max_concurrency: map 阶段同时进行的 LLM 调用数
+    """
+    if estimate_tokens(content) <= max_chunk_tokens:
+        return await generate_content_with_llm(
+            prompt=_single_prompt(content),
+            sys_prompt=SYSTEM_PROMPT_SUMMARIZE_2MD,
+            model=model,
+            temperature=SUMMARY_TEMPERATURE,
+        )
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    chunks = split_markdown(content, max_chunk_tokens)
+    logger.info(f"长文分块总结: 约 {estimate_tokens(content)} tokens，{len(chunks)} 块")
+    partials = await _summarize_chunks(chunks, model, semaphore, "一篇长文")
+
+    # 各块要点合计仍超出预算时，分组再总结，直到能放进一次汇总
+    rounds = 1
+    while estimate_tokens("\n\n".join(partials)) > max_chunk_tokens and len(partials) > 1 and rounds < SUMMARY_MAX_REDUCE_ROUNDS:
+        groups = split_markdown("\n\n".join(partials), max_chunk_tokens)
+        if len(groups) >= len(partials):
+            break  # 每条要点本身就接近预算，再分组也无法收敛
+        logger.info(f"要点仍过长，第 {rounds + 1} 轮分组汇总: {len(partials)} 条 -> {len(groups)} 组")
+        partials = await _summarize_chunks(groups, model, semaphore, "一组分段要点")
+        rounds += 1
+
+    merged = "\n\n".join(f"### 第 {i + 1} 部分要点\n{p}" for i, p in enumerate(partials))
+    return await generate_content_with_llm(
+        prompt=f"以下是一篇长文按顺序分段提取的要点，请据此对全文进行简洁明了的总结，突出关键信息，保持语言简练：\n\n{merged}\n\n总结：\n",
+        sys_prompt=SYSTEM_PROMPT_SUMMARIZE_2MD,
+        model=model,
+        temperature=SUMMARY_TEMPERATURE,
+    )
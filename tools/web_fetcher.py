@@ -0,0 +1,162 @@
+"""
+通过 Jina Reader 抓取网页正文（异步、带连接池与 TTL 缓存）。
+
+- 共享一个 httpx.AsyncClient，连接在请求之间复用，不阻塞事件循环
+- 连接 / 读取分别设置超时，响应体流式读取，超过 WEB_FETCH_MAX_BYTES 立即中止
+- 成功结果按 URL 缓存 WEB_FETCH_CACHE_TTL 秒；同一 URL 的并发请求只回源一次
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import httpx
+
+from .metrics import timed
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+JINA_API_URL = os.getenv("JINA_API_URL", "https://r.jina.ai/")
+WEB_FETCH_CONNECT_TIMEOUT = float(os.getenv("WEB_FETCH_CONNECT_TIMEOUT", "5"))
+WEB_FETCH_READ_TIMEOUT = float(os.getenv("WEB_FETCH_READ_TIMEOUT", "30"))
+WEB_FETCH_MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+WEB_FETCH_MAX_CONNECTIONS = int(os.getenv("WEB_FETCH_MAX_CONNECTIONS", "20"))
+WEB_FETCH_CACHE_TTL = float(os.getenv("WEB_FETCH_CACHE_TTL", "600"))  # 0 表示不缓存
+WEB_FETCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_FETCH_CACHE_MAX_ENTRIES", "256"))
+
+_fetch_flight = SingleFlight("fetch_web")
+
+
+class WebFetchTooLarge(Exception):
+    """响应体超过 WEB_FETCH_MAX_BYTES"""
+
+
+class WebFetchCache:
+    """
+    按 URL 缓存抓取结果的进程内 LRU，条目在 ttl 秒后过期。
+
+    参数:
+        ttl: 条目有效期（秒）
+        max_entries: 最多保留的条目数
+    """
+
+    def __init__(self, ttl=WEB_FETCH_CACHE_TTL, max_entries=WEB_FETCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # url -> (过期时间, 内容)
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            item = self._entries.get(url)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    del self._entries[url]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return item[1]
+
+    def put(self, url, content):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[url] = (time.monotonic() + self.ttl, content)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+        }
+
+
+_cache = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_web_fetch_cache():
+    """获取进程内共享的抓取缓存（懒加载）"""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = WebFetchCache()
+        return _cache
+
+
+def _get_client():
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.AsyncClient(
+                timeout=httpx.Timeout(WEB_FETCH_READ_TIMEOUT, connect=WEB_FETCH_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=WEB_FETCH_MAX_CONNECTIONS, max_keepalive_connections=WEB_FETCH_MAX_CONNECTIONS),
+                follow_redirects=True,
+            )
+        return _client
+
+
+async def shutdown_web_fetcher():
+    """关闭共享的 HTTP 客户端（FastAPI lifespan 退出时调用）"""
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.aclose()
+
+
+async def _fetch(url, api_key, max_bytes):
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    async with _get_client().stream("GET", f"{JINA_API_URL}{url}", headers=headers) as response:
+        response.raise_for_status()
+        declared = int(response.headers.get("content-length") or 0)
+        if declared > max_bytes:
+            raise WebFetchTooLarge(f"网页内容过大: {declared} 字节（上限 {max_bytes}）")
+        chunks, size = [], 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > max_bytes:
+                raise WebFetchTooLarge(f"网页内容超过上限 {max_bytes} 字节")
+            chunks.append(chunk)
+        return b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+
+
+async def fetch_web(url, api_key, max_bytes=WEB_FETCH_MAX_BYTES, use_cache=True):
+    """
+    通过 Jina Reader 抓取网页正文，返回文本。
+
+    参数:
+        url: 目标网页地址
+        api_key: Jina API 密钥
+        max_bytes: 响应体大小上限，超过时抛出 WebFetchTooLarge
+        use_cache: 是否读写 URL 缓存
+
+    超时抛出 httpx.TimeoutException，上游返回错误状态码时抛出 httpx.HTTPStatusError。
+    """
+    cache = get_web_fetch_cache() if use_cache else None
+    if cache is not None:
+        content = cache.get(url)
+        if content is not None:
+            logger.info(f"网页缓存命中: {url}")
+            return content
+
+    async def fetch_and_store():
+        with timed("web_fetch"):
+            content = await _fetch(url, api_key, max_bytes)
+        if cache is not None:
+            cache.put(url, content)
+        return content
+
+    return await _fetch_flight.do(url, fetch_and_store)